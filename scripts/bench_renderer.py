@@ -0,0 +1,218 @@
+# scripts/bench_renderer.py
+# Benchmark offline do renderer: pipeline completo (renderer.main) sem credenciais Google
+# - Armazenamento local (STORAGE_BACKEND=local): LocalDrive sobre o mesmo layout de pastas
+# - TTS trocado por um tom sintético; imagens e músicas geradas na hora
+# - Relata jobs/hora, fps de encode e tempo por estágio (a partir do metrics_renderer_*.jsonl)
+#
+# Uso:
+#   python scripts/bench_renderer.py --jobs 4 --duration 60 --width 1280 --height 720
+#   python scripts/bench_renderer.py --jobs 4 --json out.json -- --share-video
+#   python scripts/bench_renderer.py --baseline out.json --tolerance 0.15   (falha se jobs/hora cair >15%)
+#
+# Argumentos depois de "--" vão direto para o renderer.
+
+import os, sys, json, time, random, shutil, argparse, tempfile
+import subprocess as sp
+from datetime import datetime, timezone, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_LANGS = ("pt", "en", "es", "pl")
+BENCH_SLOTS = ("jesus_v1", "maria_v2")
+BENCH_FOLDERS = (
+    "00_config", "02_scripts_autogerados",
+    "01_assets_imagens_jesus", "01_assets_imagens_maria", "01_assets_brolls",
+    "01_assets_musicas", "01_assets_musicas_ave_maria",
+)
+
+def parse_args():
+    argv = sys.argv[1:]
+    passthrough = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, passthrough = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser(description="Benchmark offline do renderer (LocalDrive + TTS sintético).")
+    p.add_argument("--jobs", type=int, default=4, help="número de jobs no work order")
+    p.add_argument("--duration", type=int, default=60, help="duração de cada vídeo (s)")
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+    p.add_argument("--images", type=int, default=8, help="imagens sintéticas por pasta de slot")
+    p.add_argument("--voice-sec", type=float, default=30.0, help="duração da narração sintética (s)")
+    p.add_argument("--workdir", default="", help="diretório do Drive local/cache (padrão: temporário)")
+    p.add_argument("--warm-cache", action="store_true", help="mantém o cache de execuções anteriores no workdir")
+    p.add_argument("--keep", action="store_true", help="não apaga o workdir no final")
+    p.add_argument("--json", default="", help="grava o resumo em JSON")
+    p.add_argument("--baseline", default="", help="JSON de uma execução anterior para comparar")
+    p.add_argument("--tolerance", type=float, default=0.15, help="queda máxima aceita de jobs/hora vs baseline")
+    p.add_argument("--seed", type=int, default=1)
+    return p.parse_args(argv), passthrough
+
+# -------------------- ASSETS SINTÉTICOS ----------
+def make_image(path: str, w: int, h: int, rnd: random.Random):
+    # gradiente + ruído: o x264 não comprime de graça como faria com uma cor sólida
+    from PIL import Image
+    base = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    tint = Image.new("RGB", (w, h), tuple(rnd.randrange(40, 220) for _ in range(3)))
+    noise = Image.effect_noise((w, h), 48).convert("RGB")
+    img = Image.blend(Image.blend(base, tint, 0.5), noise, 0.25)
+    img.save(path, "JPEG", quality=90)
+
+def make_tone(path: str, sec: float, freq: int, channels: int = 2, rate: int = 44100):
+    sp.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=f={freq}:d={sec}",
+         "-ac", str(channels), "-ar", str(rate), path],
+        check=True,
+    )
+
+def build_drive(root_dir: str, args):
+    rnd = random.Random(args.seed)
+    shutil.rmtree(root_dir, ignore_errors=True)
+    for d in BENCH_FOLDERS:
+        os.makedirs(os.path.join(root_dir, d), exist_ok=True)
+
+    # fotos maiores que a tela, com proporções variadas (como as reais)
+    for i in range(args.images):
+        for folder in ("01_assets_imagens_jesus", "01_assets_imagens_maria"):
+            w = int(args.width * rnd.uniform(1.3, 2.0))
+            h = int(args.height * rnd.uniform(1.3, 2.0))
+            make_image(os.path.join(root_dir, folder, f"img_{i:02d}.jpg"), w, h, rnd)
+    make_tone(os.path.join(root_dir, "01_assets_musicas", "bg_01.mp3"), 90, 220)
+    make_tone(os.path.join(root_dir, "01_assets_musicas_ave_maria", "ave_01.mp3"), 90, 330)
+
+    now = datetime.now(timezone.utc)
+    orders = []
+    for i in range(args.jobs):
+        lang = BENCH_LANGS[i % len(BENCH_LANGS)]
+        slot = BENCH_SLOTS[(i // len(BENCH_LANGS)) % len(BENCH_SLOTS)]
+        group = i // len(BENCH_LANGS)
+        orders.append({
+            "job_id": f"bench_{i:03d}", "slot": slot, "idioma": lang, "title": f"Oração de paz {i}",
+            "publishAt": (now + timedelta(minutes=30 + group)).isoformat(),
+        })
+        tsv = os.path.join(root_dir, "02_scripts_autogerados", f"run_{slot}_{lang}.tsv")
+        with open(tsv, "w", encoding="utf-8") as f:
+            f.write("run\tpasso_ordem\ttipo\ttexto\n")
+            f.write("bench\t1\tabertura\tSenhor, dai-nos a paz. Amém.\n")
+            f.write("bench\t2\toracao\tPai nosso que estais no céu.\n")
+    with open(os.path.join(root_dir, "00_config", "work_orders_bench.json"), "w", encoding="utf-8") as f:
+        json.dump({"orders": orders}, f, ensure_ascii=False)
+
+# -------------------- EXECUÇÃO -------------------
+def run_renderer(args, passthrough):
+    import renderer
+
+    def synthetic_tts(text, out_wav, lang):
+        make_tone(out_wav, args.voice_sec, 440, channels=1)
+    renderer.build_tts_wav = synthetic_tts
+
+    sys.argv = ["renderer.py", "--duration", str(args.duration)] + passthrough
+    t0 = time.monotonic()
+    error = None
+    try:
+        renderer.main()
+    except Exception as e:  # jobs com falha ainda geram log/métricas
+        error = e
+    return time.monotonic() - t0, error, renderer.FPS
+
+def load_metrics(root_dir: str):
+    logs = os.path.join(root_dir, "05_logs")
+    names = sorted(n for n in os.listdir(logs) if n.startswith("metrics_renderer_"))
+    if not names:
+        return [], ""
+    with open(os.path.join(logs, names[-1]), "r", encoding="utf-8") as f:
+        records = [json.loads(ln) for ln in f if ln.strip()]
+    status = ""
+    logs_txt = sorted(n for n in os.listdir(logs) if n.startswith("log_renderer_"))
+    if logs_txt:
+        with open(os.path.join(logs, logs_txt[-1]), "r", encoding="utf-8") as f:
+            status = f.read().strip().splitlines()[-1]
+    return records, status
+
+ENCODE_STAGES = ("encode_single_pass", "slideshow_encode", "segment_encode", "final_mux", "audio_mix")
+
+def summarize(records, elapsed: float, fps: int, args):
+    stages = {}
+    for r in records:
+        st = stages.setdefault(r["stage"], {"count": 0, "wall_sec": 0.0, "cpu_sec": 0.0, "bytes": 0, "frames": 0.0})
+        st["count"] += 1
+        st["wall_sec"] += r.get("wall_sec", 0.0)
+        st["cpu_sec"] += r.get("cpu_sec", 0.0)
+        st["bytes"] += r.get("bytes", 0)
+        if r["stage"] in ENCODE_STAGES and r.get("speed"):
+            st["frames"] += r["speed"] * r["wall_sec"] * fps
+
+    processed = sum(1 for r in records if r["stage"] == "upload_video" and r.get("ok"))
+    enc = [s for n, s in stages.items() if n in ("encode_single_pass", "slideshow_encode", "segment_encode")]
+    enc_frames = sum(s["frames"] for s in enc)
+    enc_wall = sum(s["wall_sec"] for s in enc)
+    return {
+        "jobs": args.jobs, "processed": processed, "duration": args.duration,
+        "resolution": f"{args.width}x{args.height}", "elapsed_sec": round(elapsed, 2),
+        "jobs_per_hour": round(processed * 3600.0 / elapsed, 2) if elapsed > 0 else 0.0,
+        # fps por encode (soma das paredes); com encodes em paralelo o total do run é maior
+        "encode_fps": round(enc_frames / enc_wall, 1) if enc_wall > 0 else 0.0,
+        "stages": {n: {k: round(v, 3) if isinstance(v, float) else v for k, v in s.items() if k != "frames"}
+                   for n, s in stages.items()},
+    }
+
+def print_report(summary, status: str):
+    print(f"\nresolução {summary['resolution']}  duração {summary['duration']}s  "
+          f"jobs {summary['processed']}/{summary['jobs']}  tempo {summary['elapsed_sec']}s")
+    print(f"jobs/hora {summary['jobs_per_hour']}  encode fps {summary['encode_fps']}")
+    if status:
+        print(status)
+    print(f"\n{'estágio':<22}{'n':>4}{'parede(s)':>12}{'cpu(s)':>10}{'MB':>10}")
+    for name, st in sorted(summary["stages"].items(), key=lambda kv: -kv[1]["wall_sec"]):
+        print(f"{name:<22}{st['count']:>4}{st['wall_sec']:>12.2f}{st['cpu_sec']:>10.2f}{st['bytes'] / 1e6:>10.1f}")
+
+def check_baseline(summary, path: str, tolerance: float) -> bool:
+    with open(path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    ref, cur = base.get("jobs_per_hour") or 0.0, summary["jobs_per_hour"]
+    if ref <= 0:
+        return True
+    change = (cur - ref) / ref
+    print(f"\nbaseline jobs/hora {ref} -> {cur} ({change:+.1%})")
+    if change < -tolerance:
+        print(f"REGRESSÃO: queda maior que {tolerance:.0%}")
+        return False
+    return True
+
+def main():
+    args, passthrough = parse_args()
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="bench_renderer_")
+    root_dir = os.path.join(workdir, "drive")
+    cache_dir = os.path.join(workdir, "cache")
+    if not args.warm_cache:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # lidos na importação do renderer (e pelos processos spawn do pool de CPU)
+    os.environ["RENDER_WIDTH"] = str(args.width)
+    os.environ["RENDER_HEIGHT"] = str(args.height)
+    os.environ["RENDER_CACHE_DIR"] = cache_dir
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_ROOT"] = root_dir
+    os.environ.pop("DRIVE_ROOT_FOLDER_ID", None)
+    sys.path.insert(0, HERE)
+
+    try:
+        print(f"gerando assets em {root_dir} ...")
+        build_drive(root_dir, args)
+        elapsed, error, fps = run_renderer(args, passthrough)
+        records, status = load_metrics(root_dir)
+        summary = summarize(records, elapsed, fps, args)
+        print_report(summary, status)
+        if error is not None:
+            print(f"\nrenderer terminou com erro: {error}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=1)
+        ok = error is None
+        if args.baseline:
+            ok = check_baseline(summary, args.baseline, args.tolerance) and ok
+        sys.exit(0 if ok else 1)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# scripts/check_shards.py
+# Teste local de vários renderers concorrentes (shards + leases) sobre o mesmo armazenamento
+# - Monta o Drive sintético do bench (LocalDrive) e resolve as pastas uma vez antes de começar
+# - Sobe --shards x --workers-per-shard processos do renderer ao mesmo tempo, cada um com cache
+#   e worker id próprios; os do mesmo shard disputam os jobs pelos leases
+# - Confere no fim: cada job publicado exatamente uma vez, nenhuma falha, nenhum lease sobrando
+#
+# Uso:
+#   python scripts/check_shards.py --jobs 8 --shards 2 --workers-per-shard 2 --width 640 --height 360
+#   python scripts/check_shards.py --jobs 8 -- --render-mode cycle --share-video
+#
+# Argumentos depois de "--" vão direto para cada renderer.
+
+import os, re, sys, shutil, argparse, tempfile, collections
+import subprocess as sp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args():
+    argv = sys.argv[1:]
+    passthrough = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, passthrough = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser(description="Renderers concorrentes (shards + leases) sobre LocalDrive.")
+    p.add_argument("--jobs", type=int, default=8)
+    p.add_argument("--shards", type=int, default=2)
+    p.add_argument("--workers-per-shard", type=int, default=2, help="processos disputando o mesmo shard")
+    p.add_argument("--duration", type=int, default=20)
+    p.add_argument("--width", type=int, default=640)
+    p.add_argument("--height", type=int, default=360)
+    p.add_argument("--images", type=int, default=4)
+    p.add_argument("--voice-sec", type=float, default=5.0)
+    p.add_argument("--lease-ttl", type=int, default=120)
+    p.add_argument("--workdir", default="")
+    p.add_argument("--keep", action="store_true")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return p.parse_args(argv), passthrough
+
+def run_child(args, passthrough):
+    # processo de um worker: renderer com o TTS sintético do bench
+    sys.path.insert(0, HERE)
+    import renderer, bench_renderer
+    renderer.build_tts_wav = lambda text, out_wav, lang: bench_renderer.make_tone(out_wav, args.voice_sec, 440, channels=1)
+    sys.argv = ["renderer.py", "--duration", str(args.duration)] + passthrough
+    renderer.main()
+
+def prepare(root_dir: str, args):
+    sys.path.insert(0, HERE)
+    import bench_renderer
+    bench_renderer.build_drive(root_dir, args)
+    # pastas criadas antes: processos simultâneos criariam a mesma pasta ao mesmo tempo
+    from local_drive import LocalDrive
+    from drive_layout import resolve_layout
+    from job_leases import LOCKS_FOLDER
+    import renderer
+    svc = LocalDrive(root_dir)
+    folders, _ = resolve_layout(svc, "root", renderer.LAYOUT_FOLDERS)
+    resolve_layout(svc, folders["00_config"], [LOCKS_FOLDER])
+
+def check(root_dir: str, args, codes) -> bool:
+    logs = os.path.join(root_dir, "05_logs")
+    ok_count, fails = collections.Counter(), []
+    for nm in sorted(os.listdir(logs)):
+        if not nm.startswith("log_renderer_"):
+            continue
+        with open(os.path.join(logs, nm), "r", encoding="utf-8") as f:
+            for ln in f:
+                m = re.match(r"\[OK\] job_id=(\S+)", ln)
+                if m:
+                    ok_count[m.group(1)] += 1
+                if ln.startswith("[FAIL]"):
+                    fails.append(ln.strip())
+    expected = [f"bench_{i:03d}" for i in range(args.jobs)]
+    problems = []
+    for job_id in expected:
+        if ok_count[job_id] != 1:
+            problems.append(f"{job_id}: publicado {ok_count[job_id]}x")
+    leftover = os.listdir(os.path.join(root_dir, "00_config", "locks"))
+    if leftover:
+        problems.append(f"leases sobrando: {leftover}")
+    problems += fails
+    problems += [f"worker {i} saiu com código {c}" for i, c in enumerate(codes) if c]
+
+    print(f"\njobs {sum(1 for j in expected if ok_count[j] == 1)}/{len(expected)} publicados uma vez; "
+          f"workers {len(codes)}")
+    for p in problems:
+        print("PROBLEMA:", p)
+    return not problems
+
+def main():
+    args, passthrough = parse_args()
+    if args.child:
+        run_child(args, passthrough)
+        return
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="check_shards_")
+    root_dir = os.path.join(workdir, "drive")
+
+    os.environ["RENDER_WIDTH"] = str(args.width)
+    os.environ["RENDER_HEIGHT"] = str(args.height)
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_ROOT"] = root_dir
+    os.environ["RENDER_CACHE_DIR"] = os.path.join(workdir, "cache_setup")
+    os.environ.pop("DRIVE_ROOT_FOLDER_ID", None)
+    try:
+        print(f"gerando assets em {root_dir} ...")
+        prepare(root_dir, args)
+
+        procs = []
+        for shard in range(args.shards):
+            for k in range(args.workers_per_shard):
+                wid = f"s{shard}w{k}"
+                env = dict(os.environ, RENDER_CACHE_DIR=os.path.join(workdir, f"cache_{wid}"),
+                           RENDER_SHARD_INDEX=str(shard), RENDER_SHARD_COUNT=str(args.shards),
+                           RENDER_LEASES="1", RENDER_WORKER_ID=wid, LEASE_TTL_SEC=str(args.lease_ttl))
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", "--duration", str(args.duration),
+                       "--voice-sec", str(args.voice_sec), "--"] + passthrough
+                out = open(os.path.join(workdir, f"{wid}.out"), "w")
+                procs.append((wid, sp.Popen(cmd, env=env, stdout=out, stderr=sp.STDOUT), out))
+        codes = []
+        for wid, proc, out in procs:
+            codes.append(proc.wait())
+            out.close()
+            print(f"worker {wid}: código {codes[-1]}")
+        sys.exit(0 if check(root_dir, args, codes) else 1)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
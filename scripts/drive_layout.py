@@ -0,0 +1,88 @@
+# scripts/drive_layout.py
+# Resolução única da estrutura de pastas sob DRIVE_ROOT_FOLDER_ID (renderer e worker)
+# - Lista os filhos da raiz UMA vez e cria apenas as pastas que faltam
+# - Mantém um manifesto local nome->id: execuções seguintes não consultam o Drive,
+#   exceto quando o manifesto expira (LAYOUT_MANIFEST_TTL_HOURS) ou um id se mostra inválido
+# - Pastas que faltam são criadas num único batch
+
+import os, json, tempfile
+from datetime import datetime, timezone, timedelta
+
+from drive_requests import execute, batch
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+LAYOUT_MANIFEST_TTL_HOURS = float(os.getenv("LAYOUT_MANIFEST_TTL_HOURS", "").strip() or "24")
+
+def manifest_path_for(root_id: str, cache_root: str = "") -> str:
+    cache_root = cache_root or os.path.expanduser(
+        os.getenv("RENDER_CACHE_DIR", "").strip() or "~/.cache/oracao-render"
+    )
+    return os.path.join(cache_root, f"layout_{root_id}.json")
+
+def list_child_folders(svc, parent_id: str) -> dict:
+    q = f"'{parent_id}' in parents and trashed=false and mimeType='{FOLDER_MIME}'"
+    found, token = {}, None
+    while True:
+        r = execute(svc.files().list(
+            q=q, fields="nextPageToken,files(id,name)", pageSize=1000,
+            orderBy="createdTime", pageToken=token
+        ))
+        for f in r.get("files", []):
+            found.setdefault(f["name"], f["id"])
+        token = r.get("nextPageToken")
+        if not token:
+            return found
+
+def load_manifest(path: str, root_id: str, names):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if m.get("root") != root_id:
+        return None
+    ids = m.get("folders") or {}
+    if any(not ids.get(n) for n in names):
+        return None
+    try:
+        validated = datetime.fromisoformat(m["validated_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if datetime.now(timezone.utc) - validated > timedelta(hours=LAYOUT_MANIFEST_TTL_HOURS):
+        return None
+    return ids
+
+def save_manifest(path: str, root_id: str, ids: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {"root": root_id, "validated_at": datetime.now(timezone.utc).isoformat(), "folders": ids}
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def invalidate_manifest(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def resolve_layout(svc, root_id: str, names, manifest_path: str = "", refresh: bool = False):
+    """Retorna ({nome: id}, veio_do_manifesto). refresh=True ignora o manifesto salvo."""
+    names = list(names)
+    if manifest_path and not refresh:
+        cached = load_manifest(manifest_path, root_id, names)
+        if cached is not None:
+            return {n: cached[n] for n in names}, True
+
+    existing = list_child_folders(svc, root_id)
+    created = batch(svc, {
+        n: svc.files().create(body={"name": n, "mimeType": FOLDER_MIME, "parents": [root_id]}, fields="id")
+        for n in dict.fromkeys(names) if n not in existing
+    })
+    existing.update({n: f["id"] for n, f in created.items()})
+    ids = {n: existing[n] for n in names}
+
+    if manifest_path:
+        # grava todas as pastas da raiz: renderer e worker compartilham o mesmo manifesto
+        save_manifest(manifest_path, root_id, existing)
+    return ids, False
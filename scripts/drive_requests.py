@@ -0,0 +1,256 @@
+# scripts/drive_requests.py
+# Camada de requisições ao Drive (renderer e worker)
+# - Toda chamada passa por execute()/call(): token bucket no ritmo da cota e retry com backoff
+#   exponencial com jitter em 403 de rate limit, 429, 5xx e erros de rede
+# - O ritmo se adapta: cada resposta de rate limit corta a taxa pela metade, que volta aos
+#   poucos com as respostas boas
+# - batch()/list_all(): metadados independentes (existência, listagens) agrupados em
+#   BatchHttpRequest de até BATCH_MAX chamadas; só as respostas com erro transitório são reenviadas
+# - Contadores por tipo de chamada (files.list, files.create...): chamadas, retries, rate limits, falhas
+
+import os, json, time, random, socket, threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Cota do Drive: ~12.000 consultas/min por usuário, mas escritas sustentadas acima de poucas
+# por segundo já recebem userRateLimitExceeded; o padrão fica bem abaixo disso
+DRIVE_QPS = float(os.getenv("DRIVE_QPS", "").strip() or "8")
+DRIVE_BURST = int(os.getenv("DRIVE_BURST", "").strip() or "20")
+DRIVE_MAX_RETRIES = int(os.getenv("DRIVE_MAX_RETRIES", "").strip() or "6")
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 64.0
+BATCH_MAX = 100  # limite do endpoint de batch do Drive
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+NETWORK_ERRORS = (ConnectionError, TimeoutError, socket.timeout, httplib2.HttpLib2Error)
+
+def _status(e: HttpError):
+    return getattr(getattr(e, "resp", None), "status", None)
+
+def _reasons(e: HttpError):
+    try:
+        err = json.loads(e.content.decode("utf-8") if isinstance(e.content, bytes) else e.content)["error"]
+        return {d.get("reason") for d in err.get("errors", [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+def is_rate_limit(e: Exception) -> bool:
+    if not isinstance(e, HttpError):
+        return False
+    return _status(e) == 429 or (_status(e) == 403 and bool(_reasons(e) & RATE_LIMIT_REASONS))
+
+def is_transient(e: Exception) -> bool:
+    if isinstance(e, HttpError):
+        status = _status(e) or 0
+        return status >= 500 or is_rate_limit(e)
+    return isinstance(e, NETWORK_ERRORS)
+
+def _retry_after(e: Exception) -> float:
+    try:
+        return float(e.resp.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+def request_kind(req) -> str:
+    # HttpRequest do googleapiclient traz o método ("drive.files.list")
+    method = getattr(req, "methodId", "") or ""
+    return method[len("drive."):] if method.startswith("drive.") else (method or "drive")
+
+class TokenBucket:
+    """Limita a taxa de chamadas entre threads. rate <= 0 desliga o limite."""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n: int = 1) -> float:
+        """Consome n fichas, esperando se preciso; devolve o tempo esperado."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return waited
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                # um batch custa mais que o burst: espera o que cabe no burst e cobra o custo
+                # inteiro; o excedente vira dívida que as próximas chamadas pagam esperando
+                need = min(n, self.burst)
+                if self.tokens >= need:
+                    self.tokens -= n
+                    return waited
+                pause = (need - self.tokens) / self.rate
+            time.sleep(pause)
+            waited += pause
+
+    def throttle(self):
+        with self._lock:
+            if self.rate > 0:
+                self.rate = max(self.max_rate / 16, self.rate / 2)
+                self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        with self._lock:
+            if 0 < self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class DriveRequests:
+    """Executor compartilhado (thread-safe) das chamadas ao Drive de um processo."""
+
+    def __init__(self, qps: float = DRIVE_QPS, burst: int = DRIVE_BURST, max_retries: int = DRIVE_MAX_RETRIES):
+        self.bucket = TokenBucket(qps, burst)
+        self.max_retries = max_retries
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def configure(self, qps: float = None, burst: int = None, max_retries: int = None):
+        if qps is not None:
+            self.bucket = TokenBucket(qps, burst or self.bucket.burst)
+        if max_retries is not None:
+            self.max_retries = max_retries
+
+    # ---- contadores ----
+    def _count(self, kind: str, **inc):
+        with self._lock:
+            st = self._stats.setdefault(kind, {"calls": 0, "retries": 0, "rate_limited": 0, "errors": 0,
+                                               "wait_sec": 0.0, "sec": 0.0})
+            for k, v in inc.items():
+                st[k] += v
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {k: {n: round(v, 3) if isinstance(v, float) else v for n, v in st.items()}
+                    for k, st in self._stats.items()}
+
+    def summary(self) -> str:
+        parts = []
+        for kind, st in sorted(self.stats().items()):
+            extra = f" retries={st['retries']}" if st["retries"] else ""
+            extra += f" rate_limited={st['rate_limited']}" if st["rate_limited"] else ""
+            extra += f" errors={st['errors']}" if st["errors"] else ""
+            parts.append(f"{kind}={st['calls']}{extra}")
+        return " ".join(parts)
+
+    def _retrying(self, e: Exception, kind: str):
+        if is_rate_limit(e):
+            self.bucket.throttle()
+            self._count(kind, rate_limited=1)
+        self._count(kind, retries=1)
+
+    def _sleep(self, attempt: int, e: Exception):
+        # full jitter: runners que bateram no limite juntos não voltam juntos
+        delay = random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+        time.sleep(max(delay, _retry_after(e)))
+
+    # ---- chamadas ----
+    def call(self, fn, kind: str = "drive", cost: int = 1):
+        """Roda fn() (uma chamada ao Drive) com limite de taxa e retry dos erros transitórios."""
+        attempt = 0
+        while True:
+            waited = self.bucket.take(cost)
+            t0 = time.monotonic()
+            try:
+                out = fn()
+            except Exception as e:
+                self._count(kind, calls=1, wait_sec=waited, sec=time.monotonic() - t0)
+                if not is_transient(e) or attempt >= self.max_retries:
+                    self._count(kind, errors=1)
+                    raise
+                self._retrying(e, kind)
+                self._sleep(attempt, e)
+                attempt += 1
+                continue
+            self._count(kind, calls=1, wait_sec=waited, sec=time.monotonic() - t0)
+            self.bucket.recover()
+            return out
+
+    def execute(self, req, kind: str = ""):
+        # o mesmo HttpRequest pode ser reexecutado; upload resumable continua do offset aceito
+        return self.call(req.execute, kind or request_kind(req))
+
+    def batch(self, svc, reqs: dict) -> dict:
+        """Executa {chave: HttpRequest} independentes em BatchHttpRequest e devolve {chave: resposta}.
+        Respostas com erro transitório voltam no próximo batch (com backoff); um erro definitivo
+        é levantado depois que o resto terminou. Sem suporte a batch, executa uma a uma."""
+        results, failed = {}, []
+        if not hasattr(svc, "new_batch_http_request"):
+            for key, req in reqs.items():
+                try:
+                    results[key] = self.execute(req)
+                except Exception as e:
+                    failed.append(e)
+        else:
+            pending, attempt = dict(reqs), 0
+            while pending:
+                retry = {}
+                items = list(pending.items())
+                for i in range(0, len(items), BATCH_MAX):
+                    self._batch_chunk(svc, items[i:i + BATCH_MAX], results, retry, failed, attempt)
+                if retry:
+                    self._sleep(attempt, next(iter(retry.values()))[1])
+                    attempt += 1
+                pending = {k: req for k, (req, _) in retry.items()}
+        if failed:
+            raise failed[0]
+        return results
+
+    def _batch_chunk(self, svc, items, results, retry, failed, attempt):
+        keys = {str(i): key for i, (key, _) in enumerate(items)}
+        by_key = dict(items)
+
+        def done(request_id, response, exception):
+            key = keys[request_id]
+            req = by_key[key]
+            kind = request_kind(req)
+            self._count(kind, calls=1)
+            if exception is None:
+                results[key] = response
+            elif is_transient(exception) and attempt < self.max_retries:
+                self._retrying(exception, kind)
+                retry[key] = (req, exception)
+            else:
+                self._count(kind, errors=1)
+                failed.append(exception)
+
+        def run():
+            batch = svc.new_batch_http_request(callback=done)
+            for request_id, (_, req) in zip(keys, items):
+                batch.add(req, request_id=request_id)
+            batch.execute()
+        # o batch inteiro falhar (rede/5xx no envelope) é retry do call; cada item conta na cota
+        self.call(run, "batch", cost=len(items))
+
+    def list_all(self, svc, queries: dict) -> dict:
+        """Listagens completas ({chave: kwargs de files().list}) com as páginas de todas as
+        consultas pedidas juntas em batch. Devolve {chave: [arquivos]}."""
+        found = {key: [] for key in queries}
+        pending = {key: dict(kw) for key, kw in queries.items()}
+        while pending:
+            pages = self.batch(svc, {key: svc.files().list(**kw) for key, kw in pending.items()})
+            nxt = {}
+            for key, page in pages.items():
+                found[key].extend(page.get("files", []))
+                if page.get("nextPageToken"):
+                    nxt[key] = dict(pending[key], pageToken=page["nextPageToken"])
+            pending = nxt
+        return found
+
+# executor do processo: renderer e worker usam este
+DRIVE = DriveRequests()
+
+def execute(req, kind: str = ""):
+    return DRIVE.execute(req, kind)
+
+def call(fn, kind: str = "drive"):
+    return DRIVE.call(fn, kind)
+
+def batch(svc, reqs: dict) -> dict:
+    return DRIVE.batch(svc, reqs)
+
+def list_all(svc, queries: dict) -> dict:
+    return DRIVE.list_all(svc, queries)
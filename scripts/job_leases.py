@@ -0,0 +1,167 @@
+# scripts/job_leases.py
+# Vários renderers cooperando sobre o mesmo Drive (ex.: matrix de runners)
+# - Sharding determinístico: cada worker só planeja os jobs cujo hash cai no seu shard
+# - Lease por job: arquivo pequeno em 00_config/locks, renovado por heartbeat; um lease
+#   sem renovação há mais de LEASE_TTL_SEC é de um worker que morreu e pode ser retomado
+# - O Drive não tem "criar se não existe": cada candidato cria o seu arquivo, relista e
+#   fica com o job quem tiver o menor nome (carimbo de criação + worker); os demais desistem
+
+import io, re, json, time, hashlib, threading
+from datetime import datetime, timezone
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+from drive_requests import execute
+
+LOCKS_FOLDER = "locks"
+LEASE_PREFIX = "lease_"
+LEASE_FIELDS = "nextPageToken,files(id,name,modifiedTime)"
+
+def shard_of(key: str, count: int) -> int:
+    # md5 e não hash(): o mesmo job cai no mesmo shard em qualquer processo/máquina
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16) % max(1, count)
+
+def _ts(rfc3339: str) -> float:
+    s = rfc3339[:-1] + "+00:00" if rfc3339.endswith("Z") else rfc3339
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _status(e: HttpError):
+    return getattr(getattr(e, "resp", None), "status", None)
+
+class Leases:
+    """Leases de jobs de um worker. get_svc devolve o cliente Drive da thread atual
+    (o heartbeat roda numa thread própria)."""
+
+    def __init__(self, get_svc, folder_id: str, worker_id: str, ttl_sec: float = 600.0,
+                 heartbeat_sec: float = 0.0):
+        self.get_svc = get_svc
+        self.folder_id = folder_id
+        self.worker_id = re.sub(r"[^a-zA-Z0-9.-]+", "-", worker_id)[:60] or "worker"
+        self.ttl_sec = ttl_sec
+        self.heartbeat_sec = heartbeat_sec or ttl_sec / 3
+        self._held = {}    # key -> (file_id, última renovação confirmada)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- arquivos ----
+    def _prefix(self, key: str) -> str:
+        return f"{LEASE_PREFIX}{key}__"
+
+    def _body(self, key: str):
+        data = {"job": key, "worker": self.worker_id, "renewed_at": datetime.now(timezone.utc).isoformat()}
+        return MediaIoBaseUpload(io.BytesIO(json.dumps(data).encode("utf-8")), mimetype="application/json")
+
+    def _list(self, key: str):
+        """Leases existentes do job: [{id, name, modifiedTime}] ordenados pelo nome."""
+        svc, prefix = self.get_svc(), self._prefix(key)
+        q = f"'{self.folder_id}' in parents and trashed=false and name contains '{prefix}'"
+        found, token = [], None
+        while True:
+            r = execute(svc.files().list(q=q, fields=LEASE_FIELDS, pageSize=100, pageToken=token))
+            # o "contains" do Drive é por prefixo e o local por substring: confere o formato exato
+            found += [f for f in r.get("files", [])
+                      if f["name"].startswith(prefix) and re.fullmatch(r"\d{20}_.+\.json", f["name"][len(prefix):])]
+            token = r.get("nextPageToken")
+            if not token:
+                return sorted(found, key=lambda f: f["name"])
+
+    def _delete(self, file_id: str):
+        try:
+            execute(self.get_svc().files().delete(fileId=file_id))
+        except HttpError as e:
+            if _status(e) != 404:
+                raise
+
+    def _expired(self, f: dict, now: float) -> bool:
+        return now - _ts(f["modifiedTime"]) > self.ttl_sec
+
+    # ---- API ----
+    def acquire(self, key: str) -> bool:
+        """Tenta ficar com o job. False = outro worker tem um lease válido (ou venceu a disputa)."""
+        with self._lock:
+            if key in self._held:
+                return True
+        for f in self._list(key):
+            if self._expired(f, time.time()):
+                self._delete(f["id"])  # worker que morreu: o job volta a ficar livre
+            else:
+                return False
+
+        name = f"{self._prefix(key)}{time.time_ns():020d}_{self.worker_id}.json"
+        meta = {"name": name, "parents": [self.folder_id]}
+        mine = execute(self.get_svc().files().create(body=meta, media_body=self._body(key), fields="id,name"))
+
+        now = time.time()
+        live = [f for f in self._list(key) if f["id"] == mine["id"] or not self._expired(f, now)]
+        if all(f["id"] != mine["id"] for f in live):
+            live.append(mine)  # listagem ainda não enxerga o arquivo recém-criado
+        # um create repetido pelo retry (resposta perdida) deixa um gêmeo com o mesmo nome:
+        # mesmo carimbo + worker = nosso, então o gêmeo sai e não conta contra nós
+        for f in live:
+            if f["name"] == mine["name"] and f["id"] != mine["id"]:
+                self._delete(f["id"])
+        winner = min(live, key=lambda f: f["name"])
+        if winner["name"] != mine["name"]:
+            self._delete(mine["id"])
+            return False
+        with self._lock:
+            self._held[key] = (mine["id"], now)
+        self._start_heartbeat()
+        return True
+
+    def holds(self, key: str) -> bool:
+        """O lease ainda é nosso (renovado dentro do TTL e não removido por outro worker)."""
+        with self._lock:
+            held = self._held.get(key)
+        return held is not None and time.time() - held[1] < self.ttl_sec
+
+    def release(self, key: str):
+        with self._lock:
+            held = self._held.pop(key, None)
+        if held:
+            self._delete(held[0])
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_sec + 30)
+        with self._lock:
+            keys = list(self._held)
+        for key in keys:
+            try:
+                self.release(key)
+            except HttpError:
+                pass  # expira sozinho
+
+    # ---- heartbeat ----
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat_sec):
+            with self._lock:
+                held = dict(self._held)
+            for key, (file_id, _) in held.items():
+                try:
+                    execute(self.get_svc().files().update(fileId=file_id, media_body=self._body(key), fields="id"))
+                except HttpError as e:
+                    if _status(e) == 404:
+                        # expirou e outro worker retomou: o job deixa de ser nosso
+                        with self._lock:
+                            if self._held.get(key, (None,))[0] == file_id:
+                                del self._held[key]
+                    continue
+                except Exception:
+                    continue  # rede instável: tenta de novo no próximo batimento
+                with self._lock:
+                    if key in self._held:
+                        self._held[key] = (file_id, time.time())
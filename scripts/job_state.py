@@ -0,0 +1,141 @@
+# scripts/job_state.py
+# Estado do renderer entre execuções, num único arquivo SQLite
+# - work_orders: versão (id + md5/modifiedTime) e jobs já normalizados -> arquivo igual não é relido
+# - jobs: status por job_id (pending/rendering/done/failed), tentativas, tempos e ids dos artefatos
+# - O arquivo vive no cache local e é espelhado como snapshot em 00_config (renderer_state.sqlite,
+#   ou renderer_state_s<i>of<n>.sqlite por shard)
+
+import os, json, time, sqlite3, threading
+
+STATE_SNAPSHOT_NAME = "renderer_state.sqlite"
+
+def state_snapshot_name(shard_index: int = 0, shard_count: int = 1) -> str:
+    # um snapshot por shard: runners de shards diferentes não sobrescrevem o estado um do outro
+    if shard_count <= 1:
+        return STATE_SNAPSHOT_NAME
+    return f"renderer_state_s{shard_index}of{shard_count}.sqlite"
+JOB_STATUSES = ("pending", "rendering", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_orders (
+    file_id    TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    version    TEXT NOT NULL,
+    jobs_json  TEXT NOT NULL,
+    seen_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    lang        TEXT,
+    slot        TEXT,
+    publish_at  TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    started_at  REAL,
+    finished_at REAL,
+    render_sec  REAL,
+    video_id    TEXT,
+    thumb_id    TEXT,
+    error       TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+"""
+
+class JobState:
+    """Acesso thread-safe ao SQLite (uma conexão, autocommit, protegida por lock)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    # ---- work orders ----
+    def cached_work_orders(self, file_id: str, version: str):
+        """Jobs já normalizados da mesma versão do arquivo, ou None."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT version, jobs_json FROM work_orders WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        if row is None or not version or row["version"] != version:
+            return None
+        return json.loads(row["jobs_json"])
+
+    def store_work_orders(self, file_id: str, name: str, version: str, jobs):
+        with self._lock:
+            # só a versão mais recente interessa: arquivos antigos saem da tabela
+            self.db.execute("DELETE FROM work_orders WHERE file_id <> ?", (file_id,))
+            self.db.execute(
+                "INSERT OR REPLACE INTO work_orders (file_id, name, version, jobs_json, seen_at) VALUES (?, ?, ?, ?, ?)",
+                (file_id, name, version, json.dumps(jobs, ensure_ascii=False), time.time()),
+            )
+
+    # ---- jobs ----
+    def job(self, job_id: str):
+        with self._lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _upsert(self, job_id: str, status: str, **fields):
+        if status not in JOB_STATUSES:
+            raise ValueError(f"status inválido: {status}")
+        fields["status"] = status
+        fields["updated_at"] = time.time()
+        cols = ", ".join(fields)
+        marks = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in fields)
+        with self._lock:
+            self.db.execute(
+                f"INSERT INTO jobs (job_id, {cols}) VALUES (?, {marks}) "
+                f"ON CONFLICT(job_id) DO UPDATE SET {updates}",
+                (job_id, *fields.values()),
+            )
+
+    def plan(self, job_id: str, lang: str, slot: str, publish_at: str):
+        """Registra um job planejado; um job já conhecido mantém status e tentativas
+        (um "rendering" que sobrou de um run interrompido é refeito como qualquer outro)."""
+        cur = self.job(job_id)
+        self._upsert(job_id, cur["status"] if cur else "pending", lang=lang, slot=slot, publish_at=publish_at)
+
+    def start(self, job_id: str):
+        cur = self.job(job_id) or {}
+        self._upsert(job_id, "rendering", attempts=(cur.get("attempts") or 0) + 1,
+                     started_at=time.time(), finished_at=None, error=None)
+
+    def done(self, job_id: str, video_id: str = None, thumb_id: str = None):
+        cur = self.job(job_id) or {}
+        now = time.time()
+        started = cur.get("started_at")
+        self._upsert(job_id, "done", finished_at=now, render_sec=(now - started) if started else None,
+                     video_id=video_id, thumb_id=thumb_id, error=None)
+
+    def failed(self, job_id: str, error: str):
+        self._upsert(job_id, "failed", finished_at=time.time(), error=error[:1000])
+
+    def release(self, job_id: str):
+        """Job adiado (não iniciado): volta para pending sem contar tentativa."""
+        self._upsert(job_id, "pending")
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self.db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    # ---- snapshot ----
+    def snapshot(self, out_path: str):
+        """Cópia consistente do banco (API de backup do SQLite) para enviar ao Drive."""
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        dst = sqlite3.connect(out_path)
+        try:
+            with self._lock:
+                self.db.backup(dst)
+        finally:
+            dst.close()
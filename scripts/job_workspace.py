@@ -0,0 +1,116 @@
+# scripts/job_workspace.py
+# Workspace persistente por job, para retomar um job que falhou no meio
+# - Os artefatos do job (voz, mixagem, faixa de vídeo, MP4 final, thumb) ficam em
+#   <cache>/jobs/<job_id>/ em vez da tmpdir do run, que é apagada no fim
+# - manifest.json registra, por estágio, o arquivo, o md5 do conteúdo e a chave das entradas;
+#   na nova tentativa o estágio é reaproveitado se a chave for a mesma e o arquivo bater com o md5
+# - Um MP4 final pronto e não enviado só é reenviado
+# - O workspace é apagado quando o job termina; os abandonados expiram por idade
+
+import os, json, time, shutil, hashlib, threading
+
+MANIFEST_NAME = "manifest.json"
+
+def content_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_key(*parts) -> str:
+    """Assinatura das entradas de um estágio (config + md5 dos estágios anteriores)."""
+    raw = json.dumps(parts, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class JobWorkspace:
+    """Diretório e manifesto de um job. Thread-safe: a thumb é gravada no pool de thumbs
+    enquanto a thread do job grava os demais estágios."""
+
+    def __init__(self, root: str, job_id: str):
+        self.job_id = job_id
+        self.dir = os.path.join(root, job_id)
+        self.reused = []   # estágios aproveitados de uma tentativa anterior (para o log)
+        self._lock = threading.Lock()
+        self.stages = {}
+        try:
+            with open(os.path.join(self.dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                self.stages = json.load(f).get("stages") or {}
+        except (OSError, ValueError):
+            pass
+
+    def path(self, name: str) -> str:
+        os.makedirs(self.dir, exist_ok=True)
+        return os.path.join(self.dir, name)
+
+    def _save(self):
+        # chamado com o lock: troca atômica, um crash não deixa manifesto pela metade
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = os.path.join(self.dir, MANIFEST_NAME + ".part")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"job_id": self.job_id, "stages": self.stages}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, os.path.join(self.dir, MANIFEST_NAME))
+
+    def get(self, stage: str, key: str):
+        """Entrada do estágio (com "path") se a chave confere e o arquivo está íntegro; senão None."""
+        with self._lock:
+            entry = self.stages.get(stage)
+        if not entry or entry.get("key") != key or not entry.get("file"):
+            return None
+        p = os.path.join(self.dir, entry["file"])
+        try:
+            if os.path.getsize(p) != entry.get("size") or content_md5(p) != entry.get("md5"):
+                return None
+        except OSError:
+            return None
+        with self._lock:
+            if stage not in self.reused:
+                self.reused.append(stage)
+        return dict(entry, path=p)
+
+    def put(self, stage: str, key: str, path: str, **extra) -> dict:
+        """Registra a saída concluída de um estágio (o arquivo precisa estar dentro do workspace)."""
+        entry = dict(extra, file=os.path.relpath(path, self.dir), key=key, md5=content_md5(path),
+                     size=os.path.getsize(path), at=time.time())
+        with self._lock:
+            self.stages[stage] = entry
+            self._save()
+        return dict(entry, path=path)
+
+    def note(self, stage: str, **values):
+        """Registro sem arquivo (ex.: id do vídeo já enviado)."""
+        with self._lock:
+            self.stages[stage] = dict(values, at=time.time())
+            self._save()
+
+    def value(self, stage: str):
+        with self._lock:
+            entry = self.stages.get(stage)
+        return dict(entry) if entry else None
+
+    def md5(self, stage: str) -> str:
+        with self._lock:
+            return (self.stages.get(stage) or {}).get("md5", "")
+
+    def clear(self):
+        with self._lock:
+            self.stages = {}
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def prune_workspaces(root: str, max_age_sec: float) -> int:
+    """Remove workspaces sem atividade há mais de max_age_sec (job que não voltou mais)."""
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    now, removed = time.time(), 0
+    for nm in names:
+        d = os.path.join(root, nm)
+        try:
+            mtime = max([os.path.getmtime(d)] + [os.path.getmtime(os.path.join(d, f)) for f in os.listdir(d)])
+        except OSError:
+            continue
+        if now - mtime > max_age_sec:
+            shutil.rmtree(d, ignore_errors=True)
+            removed += 1
+    return removed
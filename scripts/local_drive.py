@@ -0,0 +1,244 @@
+# scripts/local_drive.py
+# Stand-in do Drive v3 (files()) sobre um diretório local, com o mesmo layout de pastas
+# - ids = caminho relativo à raiz (a raiz é "root"); pastas são diretórios
+# - Entende o subconjunto de consultas 'q' usado pelos scripts (parents/name/mimeType/trashed)
+# - get_media é compatível com MediaIoBaseDownload; create/update aceitam MediaIoBaseUpload
+
+import os, re, json, shutil, mimetypes
+from datetime import datetime, timezone
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+ROOT_ID = "root"
+
+def _rfc3339(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def _http_error(status: int, msg: str):
+    resp = httplib2.Response({"status": status})
+    body = json.dumps({"error": {"code": status, "message": msg}}).encode("utf-8")
+    return HttpError(resp, body)
+
+def to_text(v) -> str:
+    return "" if v is None else str(v)
+
+def _unescape(s: str) -> str:
+    return s.replace("\\'", "'").replace("\\\\", "\\")
+
+class _Req:
+    def __init__(self, fn, method_id: str = ""):
+        self._fn = fn
+        self.methodId = method_id  # como no HttpRequest: drive_requests conta por tipo de chamada
+
+    def execute(self, num_retries: int = 0):
+        return self._fn()
+
+class _MediaHttp:
+    """Responde às requisições Range de MediaIoBaseDownload lendo o arquivo local."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        size = os.path.getsize(self._path)
+        rng = (headers or {}).get("range") or (headers or {}).get("Range")
+        start, end = 0, size - 1
+        if rng:
+            m = re.match(r"bytes=(\d+)-(\d*)", rng)
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else size - 1, size - 1)
+        if size == 0:
+            return httplib2.Response({"status": 416, "content-range": "bytes */0"}), b""
+        with open(self._path, "rb") as f:
+            f.seek(start)
+            content = f.read(max(0, end - start + 1))
+        return httplib2.Response({"status": 206, "content-range": f"bytes {start}-{end}/{size}"}), content
+
+class _MediaRequest:
+    def __init__(self, path: str, file_id: str):
+        self.uri = f"local://{file_id}"
+        self.headers = {}
+        self.http = _MediaHttp(path)
+
+    def execute(self):
+        with open(self.http._path, "rb") as f:
+            return f.read()
+
+class LocalDrive:
+    """Objeto com a mesma forma de build("drive", "v3", ...) para as chamadas usadas pelos scripts."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    # ---- caminhos / metadados ----
+    def path_of(self, file_id: str) -> str:
+        if file_id in (ROOT_ID, "", None):
+            return self.root_dir
+        p = os.path.normpath(os.path.join(self.root_dir, file_id))
+        if not (p == self.root_dir or p.startswith(self.root_dir + os.sep)):
+            raise _http_error(404, f"File not found: {file_id}")
+        return p
+
+    def id_of(self, path: str) -> str:
+        rel = os.path.relpath(path, self.root_dir)
+        return ROOT_ID if rel == "." else rel.replace(os.sep, "/")
+
+    def meta(self, path: str, fields: str = "") -> dict:
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise _http_error(404, f"File not found: {self.id_of(path)}")
+        is_dir = os.path.isdir(path)
+        parent = os.path.dirname(path)
+        m = {
+            "id": self.id_of(path),
+            "name": os.path.basename(path) if path != self.root_dir else "",
+            "mimeType": FOLDER_MIME if is_dir else (mimetypes.guess_type(path)[0] or "application/octet-stream"),
+            "modifiedTime": _rfc3339(st.st_mtime),
+            "createdTime": _rfc3339(st.st_mtime),
+            "parents": [self.id_of(parent)] if path != self.root_dir else [],
+            "trashed": False,
+        }
+        if not is_dir:
+            # sem md5Checksum (como os arquivos nativos do Google): hashear cada arquivo a cada
+            # listagem custa mais que o próprio render; a versão fica em modifiedTime + size
+            m["size"] = str(st.st_size)
+        return m
+
+    # ---- API ----
+    def files(self):
+        return _Files(self)
+
+class _Files:
+    def __init__(self, drive: LocalDrive):
+        self._d = drive
+
+    def _match(self, clauses, path: str, meta: dict) -> bool:
+        for kind, val in clauses:
+            if kind == "name" and meta["name"] != val:
+                return False
+            if kind == "contains" and val not in meta["name"]:
+                return False
+            if kind == "mime" and meta["mimeType"] != val:
+                return False
+            if kind == "not_mime" and meta["mimeType"] == val:
+                return False
+        return True
+
+    def _parse_q(self, q: str):
+        parent, clauses = None, []
+        for part in re.split(r"\s+and\s+", to_text(q).strip()):
+            part = part.strip()
+            m = re.fullmatch(r"'(.*)'\s+in\s+parents", part)
+            if m:
+                parent = m.group(1)
+                continue
+            m = re.fullmatch(r"name\s*=\s*'(.*)'", part)
+            if m:
+                clauses.append(("name", _unescape(m.group(1))))
+                continue
+            m = re.fullmatch(r"name\s+contains\s+'(.*)'", part)
+            if m:
+                clauses.append(("contains", _unescape(m.group(1))))
+                continue
+            m = re.fullmatch(r"mimeType\s*(!?=)\s*'(.*)'", part)
+            if m:
+                clauses.append(("mime" if m.group(1) == "=" else "not_mime", m.group(2)))
+                continue
+            if re.fullmatch(r"trashed\s*=\s*false", part) or not part:
+                continue
+            raise _http_error(400, f"Consulta não suportada pelo LocalDrive: {part}")
+        return parent, clauses
+
+    def list(self, q: str = "", fields: str = "", pageSize: int = 100, pageToken=None, orderBy=None, **kwargs):
+        def run():
+            parent, clauses = self._parse_q(q)
+            if parent is None:
+                raise _http_error(400, "LocalDrive exige \"'<id>' in parents\" na consulta.")
+            base = self._d.path_of(parent)
+            try:
+                names = sorted(os.listdir(base))
+            except OSError:
+                names = []
+            found = []
+            for nm in names:
+                if nm.startswith(".") or nm.endswith(".part"):
+                    continue
+                p = os.path.join(base, nm)
+                m = self._d.meta(p, fields or "id")
+                if self._match(clauses, p, m):
+                    found.append(m)
+            for key in reversed([k.strip() for k in (orderBy or "").split(",") if k.strip()]):
+                fld, _, direction = key.partition(" ")
+                found.sort(key=lambda f: f.get(fld) or "", reverse=(direction.strip() == "desc"))
+            start = int(pageToken or 0)
+            size = max(1, int(pageSize or 100))
+            out = {"files": found[start:start + size]}
+            if start + size < len(found):
+                out["nextPageToken"] = str(start + size)
+            return out
+        return _Req(run, "drive.files.list")
+
+    def get(self, fileId: str, fields: str = "", **kwargs):
+        return _Req(lambda: self._d.meta(self._d.path_of(fileId), fields=fields), "drive.files.get")
+
+    def get_media(self, fileId: str, **kwargs):
+        p = self._d.path_of(fileId)
+        if not os.path.isfile(p):
+            raise _http_error(404, f"File not found: {fileId}")
+        return _MediaRequest(p, fileId)
+
+    def _write_media(self, path: str, media_body):
+        fd = media_body.stream()
+        fd.seek(0)
+        tmp = path + ".part"
+        with open(tmp, "wb") as out:
+            shutil.copyfileobj(fd, out, 1 << 20)
+        os.replace(tmp, path)
+
+    def create(self, body: dict, media_body=None, fields: str = "", **kwargs):
+        def run():
+            parents = body.get("parents") or [ROOT_ID]
+            parent = self._d.path_of(parents[0])
+            if not os.path.isdir(parent):
+                raise _http_error(404, f"File not found: {parents[0]}")
+            path = os.path.join(parent, body["name"])
+            if body.get("mimeType") == FOLDER_MIME:
+                os.makedirs(path, exist_ok=False)
+            elif media_body is not None:
+                # nomes repetidos não cabem num diretório: cria em modo exclusivo
+                open(path, "xb").close()
+                self._write_media(path, media_body)
+            else:
+                open(path, "xb").close()
+            return self._d.meta(path, fields=fields)
+        return _Req(run, "drive.files.create")
+
+    def update(self, fileId: str, body=None, media_body=None, fields: str = "", **kwargs):
+        def run():
+            path = self._d.path_of(fileId)
+            if not os.path.exists(path):
+                raise _http_error(404, f"File not found: {fileId}")
+            if media_body is not None:
+                self._write_media(path, media_body)
+            if body and body.get("name") and body["name"] != os.path.basename(path):
+                new_path = os.path.join(os.path.dirname(path), body["name"])
+                os.replace(path, new_path)
+                path = new_path
+            return self._d.meta(path, fields=fields)
+        return _Req(run, "drive.files.update")
+
+    def delete(self, fileId: str, **kwargs):
+        def run():
+            path = self._d.path_of(fileId)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+            else:
+                raise _http_error(404, f"File not found: {fileId}")
+            return ""
+        return _Req(run, "drive.files.delete")
@@ -4,24 +4,74 @@
 # - Processa apenas jobs com publishAt dentro da janela HORIZON_HOURS
 # - Não duplica: pula se já existir output com job_id
 # - Slideshow com movimento seguro: concat + scale+crop oscilante (sem xfade/zoompan)
-
-import os, io, json, random, tempfile, shutil, re, math, argparse
+# - Cache local de assets (id + md5/modifiedTime) com teto de tamanho e despejo LRU
+# - Pastas resolvidas numa única listagem da raiz + manifesto local nome->id
+# - Jobs em paralelo: threads para I/O do Drive, pool de processos para o ffmpeg
+# - Render em passada única: slideshow + mixagem + encode final no mesmo grafo do ffmpeg
+# - Opcional: um vídeo por slot, copiado para todos os idiomas (--share-video)
+# - Cache de TTS (narração inteira e por frase), chave = texto normalizado + voz + motor
+# - Índice local das pastas de assets, atualizado pelo feed changes.list do Drive
+# - Fotos pré-escaladas (Pillow) para a tela do movimento, em cache pelo checksum
+# - Agenda por prazo: publishAt mais cedo primeiro; com orçamento de tempo, só inicia o que cabe
+# - Métricas por estágio (JSONL ao lado do log): parede, CPU, bytes e velocidade do ffmpeg; --profile
+# - Armazenamento: Drive (padrão) ou diretório local/NFS com o mesmo layout (STORAGE_BACKEND=local)
+# - Upload em streaming: MP4 fragmentado enviado à sessão resumable enquanto o ffmpeg codifica
+# - Trilhas de fundo pré-atenuadas e em loop (WAV), em cache por checksum + duração + ganho
+# - Índice de roteiros: uma listagem de 02_scripts_autogerados; TSV interpretado em cache por id + versão
+# - Estado dos jobs em SQLite (status, tempos, ids), espelhado como snapshot em 00_config
+# - Thumbs em lote por slot (fonte e base escurecida reaproveitadas), em threads durante o encode
+# - Processos sem shell: -progress (fps/speed), timeout e detecção de trava, -threads/nice por orçamento de núcleos
+# - Modo segmented: vídeo em trechos alinhados ao GOP codificados em paralelo e unidos por cópia
+# - Modo cycle: um ciclo do slideshow codificado uma vez e repetido por cópia até target_sec
+# - Vários runners: shard por hash do job_id e lease por job em 00_config/locks (heartbeat + expiração)
+# - Workspace por job no cache com manifesto (md5 + chave de entrada por estágio): retry retoma do último estágio pronto
+# - Chamadas ao Drive via drive_requests: token bucket, backoff com jitter em rate limit/5xx, batch de metadados
+
+import os, io, json, random, tempfile, shutil, re, math, argparse, hashlib, threading, functools, wave, asyncio, time
+import contextlib, cProfile, pstats, collections, socket
 from datetime import datetime, timezone, timedelta
 import subprocess as sp
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
+import requests
 from google.oauth2.credentials import Credentials
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from drive_layout import resolve_layout, manifest_path_for, invalidate_manifest
+from drive_requests import DRIVE, execute, call, list_all, batch
+from local_drive import LocalDrive
+from job_state import JobState, STATE_SNAPSHOT_NAME, state_snapshot_name
+from job_leases import Leases, shard_of, LOCKS_FOLDER
+from job_workspace import JobWorkspace, stage_key, prune_workspaces
 
 # -------------------- CONFIG --------------------
 TARGET_SEC_DEFAULT = 480
 FPS = 30
-W, H = 1920, 1080
+W = int(os.getenv("RENDER_WIDTH", "").strip() or "1920")
+H = int(os.getenv("RENDER_HEIGHT", "").strip() or "1080")
+MOTION_W, MOTION_H = int(W * 1.10) // 2 * 2, int(H * 1.10) // 2 * 2  # tela do movimento (crop oscilante)
 MIN_SLIDESHOW_SEC = 60.0
 
+LANGS = ("pt", "en", "es", "pl")
+ASSET_FOLDERS = (
+    "01_assets_imagens_jesus", "01_assets_imagens_maria", "01_assets_brolls",
+    "01_assets_musicas", "01_assets_musicas_ave_maria",
+)
+ASSET_FIELDS = "id,name,mimeType,size,md5Checksum,modifiedTime"
+
+LAYOUT_FOLDERS = (
+    ["00_config", "02_scripts_autogerados", "05_logs"]
+    + [f"03_outputs_videos_{lg}" for lg in LANGS]
+    + [f"04_outputs_thumbnails_{lg}" for lg in LANGS]
+    + list(ASSET_FOLDERS)
+)
+
 IMG_EXTS = ('.jpg', '.jpeg', '.png')
 AUD_EXTS = ('.mp3', '.wav', '.m4a', '.aac')
 
@@ -31,6 +81,93 @@ SAY_TYPES = {
     'agradecimento','encerramento','cta','texto','mensagem'
 }
 
+# Cache persistente entre execuções (no Actions é restaurado via actions/cache)
+CACHE_ROOT = os.path.expanduser(os.getenv("RENDER_CACHE_DIR", "").strip() or "~/.cache/oracao-render")
+ASSET_CACHE_MAX_MB = int(os.getenv("ASSET_CACHE_MAX_MB", "").strip() or "4096")
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "").strip() or "1024")
+FRAME_CACHE_MAX_MB = int(os.getenv("FRAME_CACHE_MAX_MB", "").strip() or "1024")
+MUSIC_BED_CACHE_MAX_MB = int(os.getenv("MUSIC_BED_CACHE_MAX_MB", "").strip() or "1024")
+MUSIC_GAIN = 0.18  # volume da trilha sob a narração
+# Workspace por job: voz, mixagem, faixa de vídeo, MP4 final e thumb ficam em WORKSPACE_ROOT/<job_id>
+# até o job terminar, então uma nova tentativa retoma do último estágio pronto (um MP4 que não
+# subiu só é reenviado). Workspaces sem atividade há WORKSPACE_MAX_AGE_HOURS são removidos
+WORKSPACE_ROOT = os.path.join(CACHE_ROOT, "jobs")
+WORKSPACE_MAX_AGE_HOURS = int(os.getenv("WORKSPACE_MAX_AGE_HOURS", "").strip() or "48")
+
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "").strip() or "4")
+
+TTS_VOICES = {
+    "pt": "pt-BR-AntonioNeural",
+    "en": "en-US-GuyNeural",
+    "es": "es-MX-JorgeNeural",
+    "pl": "pl-PL-MarekNeural",
+}
+
+# Execução paralela: threads para I/O do Drive (um job por thread) e
+# pool de processos para os estágios de ffmpeg (CPU), com limites separados
+JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "").strip() or "4")
+CPU_WORKERS = int(os.getenv("RENDER_CPU_WORKERS", "").strip() or "2")
+
+# Orçamento de núcleos (0 = os.cpu_count()) dividido entre os workers de CPU: cada ffmpeg
+# recebe -threads = núcleos // workers, então encodes simultâneos não disputam a máquina.
+# Os workers rodam com nice FFMPEG_NICE para não atrasar as threads de upload/TTS.
+RENDER_CORES = int(os.getenv("RENDER_CORES", "").strip() or "0") or (os.cpu_count() or 1)
+FFMPEG_NICE = int(os.getenv("FFMPEG_NICE", "").strip() or "10")
+# Timeout de cada ffmpeg: mínimo + segundos de parede por segundo de mídia; sem nenhuma
+# linha de progresso por FFMPEG_STALL_SEC o processo é considerado travado e morto
+FFMPEG_TIMEOUT_MIN_SEC = int(os.getenv("FFMPEG_TIMEOUT_MIN_SEC", "").strip() or "300")
+FFMPEG_TIMEOUT_PER_MEDIA_SEC = float(os.getenv("FFMPEG_TIMEOUT_PER_MEDIA_SEC", "").strip() or "4")
+FFMPEG_STALL_SEC = int(os.getenv("FFMPEG_STALL_SEC", "").strip() or "180")
+PROGRESS_LOG_SEC = int(os.getenv("FFMPEG_PROGRESS_LOG_SEC", "").strip() or "30")  # 0 = não imprime
+
+# single   = slideshow + mixagem + encode final num único ffmpeg
+# two_pass = legado: slideshow intermediário, mixagem em WAV e re-encode no mux
+# segmented = vídeo em trechos alinhados ao GOP, codificados em paralelo no pool de CPU e
+#             unidos por cópia (concat demuxer); o mux final só codifica o áudio
+# cycle     = como segmented, mas o vídeo é periódico (imagens e movimento repetem a cada ciclo):
+#             só um ciclo é codificado e as voltas seguintes são cópias dele
+RENDER_MODES = ("single", "two_pass", "segmented", "cycle")
+RENDER_MODE = os.getenv("RENDER_MODE", "").strip() or "single"
+# Idiomas do mesmo slot/publishAt compartilham um único vídeo (só o áudio muda)
+SHARE_VIDEO = os.getenv("RENDER_SHARE_VIDEO", "").strip().lower() in ("1", "true", "yes")
+# Trechos por vídeo no modo segmented (0 = um por worker de CPU). Cada trecho tem um número
+# inteiro de GOPs fechados de SEGMENT_GOP_SEC e pelo menos SEGMENT_MIN_SEC
+ENCODE_SEGMENTS = int(os.getenv("RENDER_SEGMENTS", "").strip() or "0")
+SEGMENT_GOP_SEC = 2
+SEGMENT_MIN_SEC = 30
+
+# Orçamento da execução em segundos (0 = sem limite). Jobs cuja estimativa não cabe
+# no tempo restante não são iniciados e ficam para o próximo tick do cron.
+RUN_BUDGET_SEC = int(os.getenv("RUN_BUDGET_SEC", "").strip() or "0")
+# Estimativa inicial por estágio, antes de haver histórico. "video" e "mux" são
+# segundos de processamento por segundo de vídeo final; os demais, segundos por job.
+STAGE_DEFAULTS = {"narration": 45.0, "video": 1.0, "mux": 0.05, "upload": 30.0}
+STAGE_EMA_ALPHA = 0.3
+
+# drive = API do Google Drive (OAuth); local = diretório com o mesmo layout de pastas
+# (00_config, 01_assets_*, 03_outputs_*...), ex.: espelho local/NFS na máquina de render
+STORAGE_BACKENDS = ("drive", "local")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "").strip().lower() or "drive"
+LOCAL_STORAGE_ROOT = os.path.expanduser(os.getenv("LOCAL_STORAGE_ROOT", "").strip())
+
+# Upload do MP4 final em streaming (só no backend drive): o ffmpeg grava MP4 fragmentado
+# e os chunks vão para a sessão resumable do Drive durante o encode
+STREAM_UPLOAD = os.getenv("RENDER_STREAM_UPLOAD", "").strip().lower() in ("1", "true", "yes")
+UPLOAD_CHUNK_MB = int(os.getenv("UPLOAD_CHUNK_MB", "").strip() or "8")  # arredondado p/ múltiplo de 256 KiB
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "").strip() or "6")
+
+# Vários runners (ex.: matrix): cada um processa o shard SHARD_INDEX de SHARD_COUNT (hash do
+# job_id; com --share-video, do slot + publishAt) e segura cada job com um lease em
+# 00_config/locks, renovado por heartbeat e retomável depois de LEASE_TTL_SEC sem renovação.
+# Leases ligados por padrão com mais de um shard; RENDER_LEASES=1 liga também com um só
+# (ex.: execuções do cron que se sobrepõem)
+SHARD_INDEX = int(os.getenv("RENDER_SHARD_INDEX", "").strip() or "0")
+SHARD_COUNT = int(os.getenv("RENDER_SHARD_COUNT", "").strip() or "1")
+LEASE_TTL_SEC = int(os.getenv("LEASE_TTL_SEC", "").strip() or "600")
+_leases_env = os.getenv("RENDER_LEASES", "").strip().lower()
+USE_LEASES = True if _leases_env in ("1", "true", "yes") else False if _leases_env in ("0", "false", "no") else None
+WORKER_ID = os.getenv("RENDER_WORKER_ID", "").strip() or f"{socket.gethostname()}-{os.getpid()}"
+
 SCOPES = [
     "https://www.googleapis.com/auth/drive.readonly",
     "https://www.googleapis.com/auth/drive.metadata.readonly",
@@ -38,15 +175,125 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets.readonly",
 ]
 
-# -------------------- SHELL ---------------------
-def sh(cmd: str) -> str:
-    cp = sp.run(cmd, shell=True, stdout=sp.PIPE, stderr=sp.STDOUT, text=True)
-    if cp.returncode != 0:
-        raise RuntimeError(cp.stdout)
-    return cp.stdout
+# -------------------- PROCESSOS -----------------
+class ProcError(RuntimeError):
+    """Processo saiu com erro ou foi morto (timeout/travado); a mensagem traz o fim do stderr."""
+
+def thread_budget(cpu_workers: int) -> int:
+    return max(1, RENDER_CORES // max(1, cpu_workers))
+
+_proc_threads = thread_budget(CPU_WORKERS)
+_proc_local = threading.local()
+
+def init_cpu_worker(threads: int, nice: int):
+    """Initializer dos processos do pool de CPU: fatia de núcleos por ffmpeg e prioridade menor
+    (herdada pelos filhos)."""
+    global _proc_threads
+    _proc_threads = max(1, threads)
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+def run_proc(args, timeout=None, stall_sec=None, on_line=None) -> str:
+    """Roda args (lista, sem shell). O stdout vai linha a linha para on_line ou é devolvido;
+    do stderr fica só o final, para a mensagem de erro. timeout = limite total em segundos;
+    stall_sec = limite sem nenhuma linha nova no stdout."""
+    out, tail = [], collections.deque(maxlen=40)
+    last = [time.monotonic()]
+
+    def read_stdout(stream):
+        for line in stream:
+            last[0] = time.monotonic()
+            if on_line:
+                on_line(line)
+            else:
+                out.append(line)
+
+    proc = sp.Popen(args, stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.PIPE, text=True, errors="replace")
+    readers = [
+        threading.Thread(target=read_stdout, args=(proc.stdout,), daemon=True),
+        threading.Thread(target=tail.extend, args=(proc.stderr,), daemon=True),
+    ]
+    for t in readers:
+        t.start()
+
+    t0, killed = time.monotonic(), None
+    try:
+        while True:
+            try:
+                proc.wait(timeout=1.0)
+                break
+            except sp.TimeoutExpired:
+                now = time.monotonic()
+                if timeout and now - t0 > timeout:
+                    killed = f"timeout de {timeout:.0f}s"
+                elif stall_sec and now - last[0] > stall_sec:
+                    killed = f"sem progresso por {stall_sec:.0f}s"
+                if killed:
+                    proc.kill()
+                    proc.wait()
+                    break
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for t in readers:
+            t.join(timeout=5)
+
+    if killed or proc.returncode != 0:
+        why = killed or f"saiu com código {proc.returncode}"
+        raise ProcError(f"{os.path.basename(args[0])} {why}:\n" + "".join(tail))
+    return "".join(out)
+
+def _num(v):
+    try:
+        return float(to_str(v).rstrip("x"))
+    except ValueError:
+        return None
+
+def ffmpeg(args, media_sec: float = 0.0, tag: str = "") -> dict:
+    """ffmpeg com -progress em pipe: -threads do orçamento do processo, timeout proporcional
+    à mídia e trava detectada pela falta de progresso. args termina no arquivo de saída.
+    Devolve o último progresso (frames, fps, speed, out_sec)."""
+    n = str(_proc_threads)
+    cmd = (["ffmpeg", "-hide_banner", "-nostats", "-y", "-progress", "pipe:1",
+            "-filter_threads", n, "-filter_complex_threads", n]
+           + list(args[:-1]) + ["-threads", n, args[-1]])
+    tag = tag or os.path.basename(args[-1])
+    cur, stats = {}, {}
+    logged = [time.monotonic()]
+
+    def on_line(line: str):
+        key, _, val = line.strip().partition("=")
+        if key != "progress":
+            cur[key] = val
+            return
+        # fim de um bloco de progresso (progress=continue|end)
+        stats.update({k: v for k, v in (
+            ("frames", _num(cur.get("frame"))), ("fps", _num(cur.get("fps"))),
+            ("speed", _num(cur.get("speed"))), ("out_sec", (_num(cur.get("out_time_us")) or 0) / 1e6 or None),
+        ) if v is not None})
+        if "frames" in stats:
+            stats["frames"] = int(stats["frames"])
+        now = time.monotonic()
+        if PROGRESS_LOG_SEC and val == "continue" and now - logged[0] >= PROGRESS_LOG_SEC:
+            logged[0] = now
+            print(f"[ffmpeg] {tag} t={stats.get('out_sec', 0):.0f}/{media_sec:.0f}s "
+                  f"fps={stats.get('fps', 0):.1f} speed={stats.get('speed', 0):.2f}x", flush=True)
+
+    timeout = FFMPEG_TIMEOUT_MIN_SEC + media_sec * FFMPEG_TIMEOUT_PER_MEDIA_SEC
+    run_proc(cmd, timeout=timeout, stall_sec=FFMPEG_STALL_SEC, on_line=on_line)
+    done = getattr(_proc_local, "stats", None)
+    if done is not None:
+        done.append(stats)
+    return stats
 
 def ffprobe_duration(path: str) -> float:
-    out = sh(f'ffprobe -v error -show_entries format=duration -of default=nw=1:nk=1 "{path}"')
+    out = run_proc(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                    "-of", "default=nw=1:nk=1", path], timeout=120)
     return float(out.strip())
 
 def to_str(v) -> str:
@@ -73,8 +320,99 @@ def parse_iso_utc(s: str):
     except Exception:
         return None
 
+# -------------------- CACHE LOCAL ---------------
+class LruDiskCache:
+    """Cache em disco por chave, com teto de tamanho e despejo LRU (mtime = último uso)."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        h = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, h[:2], h + suffix)
+
+    def get(self, key: str, suffix: str = ""):
+        p = self.path_for(key, suffix)
+        try:
+            os.utime(p, None)
+        except OSError:
+            return None
+        return p
+
+    def put(self, key: str, producer, suffix: str = "") -> str:
+        # producer(tmp_path) grava o conteúdo; a troca é atômica (os.replace)
+        p = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(p), suffix=".part"); os.close(fd)
+        try:
+            producer(tmp)
+            os.replace(tmp, p)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=p)
+        return p
+
+    def fetch(self, key: str, producer, suffix: str = "") -> str:
+        return self.get(key, suffix) or self.put(key, producer, suffix)
+
+    def evict(self, keep: str = ""):
+        with self._lock:
+            entries, total = [], 0
+            for dirpath, _, names in os.walk(self.root):
+                for nm in names:
+                    if nm.endswith(".part"):
+                        continue
+                    fp = os.path.join(dirpath, nm)
+                    try:
+                        st = os.stat(fp)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, fp))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, fp in sorted(entries):
+                if fp == keep:
+                    continue
+                try:
+                    os.remove(fp)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+def link_or_copy(src: str, dst: str):
+    # hardlink protege o arquivo da tmpdir contra despejo do cache durante o job
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+ASSET_CACHE = (
+    LruDiskCache(os.path.join(CACHE_ROOT, "assets"), ASSET_CACHE_MAX_MB * 1024 * 1024)
+    if ASSET_CACHE_MAX_MB > 0 else None
+)
+BED_CACHE = (
+    LruDiskCache(os.path.join(CACHE_ROOT, "beds"), MUSIC_BED_CACHE_MAX_MB * 1024 * 1024)
+    if MUSIC_BED_CACHE_MAX_MB > 0 else None
+)
+FRAME_CACHE = (
+    LruDiskCache(os.path.join(CACHE_ROOT, "frames"), FRAME_CACHE_MAX_MB * 1024 * 1024)
+    if FRAME_CACHE_MAX_MB > 0 else None
+)
+TTS_CACHE = (
+    LruDiskCache(os.path.join(CACHE_ROOT, "tts"), TTS_CACHE_MAX_MB * 1024 * 1024)
+    if TTS_CACHE_MAX_MB > 0 else None
+)
+
 # -------------------- AUTH (OAUTH) --------------
-def build_drive_service_oauth():
+def build_oauth_credentials():
     client_id = os.getenv("OAUTH_CLIENT_ID", "").strip()
     client_secret = os.getenv("OAUTH_CLIENT_SECRET", "").strip()
     refresh_token = os.getenv("OAUTH_REFRESH_TOKEN", "").strip()
@@ -91,33 +429,82 @@ def build_drive_service_oauth():
         scopes=SCOPES
     )
     creds.refresh(Request())
-    return build("drive", "v3", credentials=creds)
+    return creds
+
+def build_drive_service_oauth(creds=None):
+    creds = creds or build_oauth_credentials()
+    return build("drive", "v3", credentials=creds, cache_discovery=False)
+
+class DriveClients:
+    """Um cliente Drive por thread (httplib2 não é thread-safe), criado sob demanda."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self.creds = None  # só no backend drive (upload resumable direto)
+
+    def get(self):
+        svc = getattr(self._local, "svc", None)
+        if svc is None:
+            svc = self._local.svc = self._factory()
+        return svc
+
+def build_storage_clients(backend: str = STORAGE_BACKEND):
+    """Clientes por thread do backend escolhido; o LocalDrive responde às mesmas chamadas files()."""
+    if backend == "local":
+        if not LOCAL_STORAGE_ROOT:
+            raise RuntimeError("STORAGE_BACKEND=local exige LOCAL_STORAGE_ROOT.")
+        if not os.path.isdir(LOCAL_STORAGE_ROOT):
+            raise RuntimeError(f"LOCAL_STORAGE_ROOT não existe: {LOCAL_STORAGE_ROOT}")
+        DRIVE.configure(qps=0)  # armazenamento local não tem cota
+        return DriveClients(lambda: LocalDrive(LOCAL_STORAGE_ROOT))
+    if backend != "drive":
+        raise RuntimeError(f"STORAGE_BACKEND inválido: {backend} (use {'/'.join(STORAGE_BACKENDS)}).")
+    creds = build_oauth_credentials()
+    clients = DriveClients(lambda: build_drive_service_oauth(creds))
+    clients.creds = creds
+    return clients
+
+def is_local_storage(svc) -> bool:
+    return isinstance(svc, LocalDrive)
 
 # -------------------- DRIVE HELPERS -------------
+def by_name_query(parent_id: str, name: str) -> dict:
+    return {"q": f"'{parent_id}' in parents and trashed=false and name='{name}'",
+            "fields": "files(id,name,size,md5Checksum,modifiedTime)"}
+
+def file_version(f: dict) -> str:
+    # md5 do conteúdo; sem ele (backend local, arquivos nativos do Google) vale modifiedTime + size
+    if f.get("md5Checksum"):
+        return to_str(f["md5Checksum"])
+    mtime = to_str(f.get("modifiedTime"))
+    return f"{mtime}:{f['size']}" if mtime and f.get("size") else mtime
+
 def list_by_name(svc, parent_id: str, name: str):
-    q = f"'{parent_id}' in parents and trashed=false and name='{name}'"
-    r = svc.files().list(q=q, fields="files(id,name)").execute()
-    return r.get("files", [])
+    return execute(svc.files().list(**by_name_query(parent_id, name))).get("files", [])
 
-def ensure_folder(svc, parent_id: str, name: str) -> str:
-    r = list_by_name(svc, parent_id, name)
-    if r:
-        return r[0]["id"]
-    meta = {"name": name, "mimeType": "application/vnd.google-apps.folder", "parents": [parent_id]}
-    return svc.files().create(body=meta, fields="id").execute()["id"]
+def folder_query(folder_id: str, page_size: int = 1000) -> dict:
+    return {"q": f"'{folder_id}' in parents and trashed=false",
+            "fields": f"nextPageToken,files({ASSET_FIELDS})", "pageSize": page_size}
 
 def list_files_in_folder(svc, folder_id: str, page_size: int = 1000):
-    q = f"'{folder_id}' in parents and trashed=false"
-    r = svc.files().list(q=q, fields="files(id,name,mimeType,size,modifiedTime)", pageSize=page_size).execute()
-    return r.get("files", [])
-
-def file_exists_by_name_contains(svc, folder_id: str, needle: str) -> bool:
-    needle = to_str(needle)
-    if not needle:
-        return False
-    q = f"'{folder_id}' in parents and trashed=false and name contains '{needle}'"
-    r = svc.files().list(q=q, fields="files(id,name)", pageSize=1).execute()
-    return bool(r.get("files"))
+    return list_all(svc, {folder_id: folder_query(folder_id, page_size)})[folder_id]
+
+def rendered_query(folder_id: str) -> dict:
+    q = f"'{folder_id}' in parents and trashed=false and mimeType!='application/vnd.google-apps.folder'"
+    return {"q": q, "fields": "nextPageToken,files(name)", "pageSize": 1000}
+
+def list_rendered_job_ids(svc, folder_ids) -> dict:
+    # listagem paginada das pastas de saída (juntas, em batch) => job_ids já renderizados ({job_id}.mp4)
+    pages = list_all(svc, {fid: rendered_query(fid) for fid in folder_ids})
+    done = {}
+    for fid, files in pages.items():
+        done[fid] = set()
+        for f in files:
+            stem, ext = os.path.splitext(f["name"])
+            if ext.lower() == ".mp4":
+                done[fid].add(stem)
+    return done
 
 def download_text(svc, file_id: str) -> str:
     req = svc.files().get_media(fileId=file_id)
@@ -125,44 +512,204 @@ def download_text(svc, file_id: str) -> str:
     dl = MediaIoBaseDownload(buf, req)
     done = False
     while not done:
-        _, done = dl.next_chunk()
+        _, done = call(dl.next_chunk, "files.get_media")
     return buf.getvalue().decode("utf-8")
 
 def download_binary(svc, file_id: str, out_path: str):
+    if is_local_storage(svc):
+        # arquivo já está no disco: link/cópia direta, sem os chunks do MediaIoBaseDownload
+        link_or_copy(svc.path_of(file_id), out_path)
+        return
     req = svc.files().get_media(fileId=file_id)
     with open(out_path, "wb") as out:
         dl = MediaIoBaseDownload(out, req)
         done = False
         while not done:
-            _, done = dl.next_chunk()
+            _, done = call(dl.next_chunk, "files.get_media")
+
+def download_asset(svc, f: dict, out_path: str):
+    # f = metadados do Drive (id, name, md5Checksum/modifiedTime/size); sem versão não há como cachear
+    version = file_version(f)
+    # no backend local o próprio armazenamento já é o "cache": não duplica os arquivos
+    if ASSET_CACHE is None or not version or is_local_storage(svc):
+        download_binary(svc, f["id"], out_path)
+        return
+    ext = os.path.splitext(to_str(f.get("name")))[1].lower()
+    src = ASSET_CACHE.fetch(f"{f['id']}:{version}", lambda tmp: download_binary(svc, f["id"], tmp), suffix=ext)
+    link_or_copy(src, out_path)
 
 def upload_file(svc, parent_id: str, local_path: str, name: str, mime: str) -> str:
     meta = {"name": name, "parents": [parent_id]}
-    media = MediaIoBaseUpload(open(local_path, "rb"), mimetype=mime, resumable=True)
-    return svc.files().create(body=meta, media_body=media, fields="id").execute()["id"]
-
-def pick_random_local(svc, folder_id: str, exts):
-    files = list_files_in_folder(svc, folder_id)
+    with open(local_path, "rb") as fh:
+        media = MediaIoBaseUpload(fh, mimetype=mime, resumable=True)
+        return execute(svc.files().create(body=meta, media_body=media, fields="id"))["id"]
+
+UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&fields=id"
+
+def upload_chunk_bytes() -> int:
+    q = 256 * 1024  # o Drive exige chunks intermediários múltiplos de 256 KiB
+    return max(q, UPLOAD_CHUNK_MB * 1024 * 1024 // q * q)
+
+def upload_growing_file(creds, parent_id: str, local_path: str, name: str, mime: str, finished) -> str:
+    """Envia local_path para uma sessão resumable do Drive enquanto o arquivo ainda cresce.
+    finished() só deve retornar True quando o escritor terminou com sucesso: aí o tamanho
+    final é conhecido e o último chunk fecha a sessão. Falhas transitórias (rede, 5xx, 429)
+    consultam o offset aceito pelo servidor e retomam dali, relendo do disco."""
+    session = AuthorizedSession(creds)
+    r = session.post(UPLOAD_URL, json={"name": name, "parents": [parent_id]},
+                     headers={"X-Upload-Content-Type": mime})
+    if r.status_code != 200:
+        raise RuntimeError(f"Sessão resumable recusada ({r.status_code}): {r.text[:300]}")
+    uri = r.headers["Location"]
+    chunk = upload_chunk_bytes()
+    while not os.path.exists(local_path) and not finished():
+        time.sleep(0.25)
+
+    offset, retries, probe = 0, 0, False
+    with open(local_path, "rb") as f:
+        ino = os.fstat(f.fileno()).st_ino
+        while True:
+            done = finished()
+            st = os.stat(local_path)
+            size = st.st_size
+            if st.st_ino != ino or size < offset:
+                # arquivo recriado ou truncado: os bytes já enviados não são mais deste arquivo
+                raise RuntimeError(f"{os.path.basename(local_path)} foi substituído ou truncado durante o upload "
+                                   f"(offset {offset}, tamanho {size}).")
+            total = str(size) if done else "*"
+            if probe:
+                # só pergunta quanto o servidor já recebeu
+                data, rng = b"", f"bytes */{total}"
+            else:
+                avail = size - offset
+                if not done and avail <= chunk:
+                    # segura o último pedaço: o chunk final precisa levar o tamanho total
+                    time.sleep(0.25)
+                    continue
+                n = min(chunk, avail)
+                f.seek(offset)
+                data = f.read(n)
+                last = done and n == avail
+                rng = f"bytes {offset}-{offset + n - 1}/{size if last else '*'}" if n else f"bytes */{size}"
+
+            try:
+                r = session.put(uri, data=data, headers={"Content-Range": rng}, timeout=300)
+            except requests.RequestException:
+                r = None
+
+            if r is not None and r.status_code in (200, 201):
+                return r.json()["id"]
+            if r is not None and r.status_code == 308:
+                # Range: bytes=0-N => o servidor tem até N; sem Range => nada ainda
+                m = re.match(r"bytes=0-(\d+)", r.headers.get("Range", ""))
+                offset = int(m.group(1)) + 1 if m else 0
+                retries, probe = 0, False
+                continue
+            if r is not None and r.status_code < 500 and r.status_code != 429:
+                raise RuntimeError(f"Upload resumable falhou ({r.status_code}): {r.text[:300]}")
+            retries += 1
+            if retries > UPLOAD_MAX_RETRIES:
+                raise RuntimeError(f"Upload resumable: {UPLOAD_MAX_RETRIES} tentativas sem sucesso.")
+            time.sleep(min(2 ** retries, 30) + random.random())
+            probe = True
+
+def pick_random_local(svc, folder_id: str, exts, index=None):
+    files = index.files(folder_id) if index else list_files_in_folder(svc, folder_id)
     cand = [f for f in files if any(f["name"].lower().endswith(e) for e in exts)]
     if not cand:
         return None, None
     f = random.choice(cand)
     fd, tmp = tempfile.mkstemp(suffix="_" + f["name"]); os.close(fd)
-    download_binary(svc, f["id"], tmp)
+    download_asset(svc, f, tmp)
     return tmp, f["name"]
 
-def download_many_images(svc, folder_id: str, limit: int):
-    files = list_files_in_folder(svc, folder_id)
+def download_many_images(svc, folder_id: str, limit: int, index=None):
+    files = index.files(folder_id) if index else list_files_in_folder(svc, folder_id)
     imgs = [f for f in files if any(f["name"].lower().endswith(e) for e in IMG_EXTS)]
     random.shuffle(imgs)
     imgs = imgs[:limit] if limit else imgs
     paths, names = [], []
     for f in imgs:
         fd, tmp = tempfile.mkstemp(suffix="_" + f["name"]); os.close(fd)
-        download_binary(svc, f["id"], tmp)
+        download_asset(svc, f, tmp)
         paths.append(tmp); names.append(f["name"])
     return paths, names
 
+# -------------------- ÍNDICE DE ASSETS ----------
+class AssetIndex:
+    """Conteúdo das pastas de assets, persistido entre execuções.
+    A primeira execução lista cada pasta por completo (paginado); as seguintes só aplicam
+    o feed changes.list do Drive a partir do último startPageToken."""
+
+    def __init__(self, path: str, root_id: str):
+        self.path = path
+        self.root_id = root_id
+        self.token = None
+        self.folders = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("root") == root_id:
+                self.token = data.get("token")
+                self.folders = data.get("folders") or {}
+        except (OSError, ValueError):
+            pass
+
+    def files(self, folder_id: str):
+        return list(self.folders.get(folder_id, {}).values())
+
+    def sync(self, svc, folder_ids):
+        folder_ids = list(folder_ids)
+        if not hasattr(svc, "changes"):
+            # backend sem feed de mudanças: listar de novo é o único jeito de ficar atual
+            self.token = None
+            self.folders = {}
+        elif self.token:
+            try:
+                self._apply_changes(svc, folder_ids)
+            except HttpError:
+                # token expirado/inválido: volta para a listagem completa
+                self.token = None
+                self.folders = {}
+        if hasattr(svc, "changes") and not self.token:
+            # token pego ANTES da listagem: mudanças durante a listagem não se perdem
+            self.token = execute(svc.changes().getStartPageToken())["startPageToken"]
+        # pastas sem índice: páginas de todas pedidas juntas em batch
+        missing = [fid for fid in folder_ids if fid not in self.folders]
+        for fid, files in list_all(svc, {fid: folder_query(fid) for fid in missing}).items():
+            self.folders[fid] = {f["id"]: f for f in files}
+        self.folders = {fid: self.folders[fid] for fid in folder_ids}
+        self.save()
+
+    def _apply_changes(self, svc, folder_ids):
+        tracked = set(folder_ids)
+        token = self.token
+        while token:
+            r = execute(svc.changes().list(
+                pageToken=token, pageSize=1000, spaces="drive", includeRemoved=True,
+                fields=f"nextPageToken,newStartPageToken,changes(fileId,removed,file({ASSET_FIELDS},parents,trashed))",
+            ))
+            for ch in r.get("changes", []):
+                fid = ch.get("fileId")
+                for entries in self.folders.values():
+                    entries.pop(fid, None)
+                f = ch.get("file") or {}
+                if ch.get("removed") or f.get("trashed") or f.get("mimeType") == "application/vnd.google-apps.folder":
+                    continue
+                for parent in f.get("parents", []):
+                    if parent in tracked and parent in self.folders:
+                        self.folders[parent][fid] = {k: f[k] for k in f if k not in ("parents", "trashed")}
+            if r.get("newStartPageToken"):
+                self.token = r["newStartPageToken"]
+            token = r.get("nextPageToken")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"root": self.root_id, "token": self.token, "folders": self.folders}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
 # -------------------- TSV -----------------------
 def load_tsv_rows(tsv_path: str):
     rows = []
@@ -217,17 +764,81 @@ def narration_from_rows(rows):
 
     return base, policy, faixa_ave_maria
 
+class ScriptIndex:
+    """Roteiros run_*.tsv de 02_scripts_autogerados. A lista vem do AssetIndex (a pasta entra
+    no mesmo sync); narração/política/faixa já interpretadas ficam em cache por id + versão,
+    então um roteiro é baixado e lido uma vez, não uma vez por job."""
+
+    def __init__(self, path: str, files):
+        self.path = path
+        self._lock = threading.Lock()
+        self.dirty = False
+        self.by_name = {}
+        # nomes repetidos: vale o mais recente
+        for f in sorted(files, key=lambda f: to_str(f.get("modifiedTime"))):
+            self.by_name[f["name"]] = f
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                self.entries = json.load(fh).get("scripts") or {}
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def find(self, slot: str, lang: str):
+        for nm in (f"run_{slot}_{lang}.tsv", f"run_{slot}.tsv"):
+            if nm in self.by_name:
+                return self.by_name[nm]
+        return None
+
+    def parsed(self, svc, f: dict, tsv_local: str):
+        """Retorna (entrada, veio_do_cache); entrada = {narration, policy, faixa_ave_maria}."""
+        version = to_str(f.get("modifiedTime") or f.get("md5Checksum"))
+        with self._lock:
+            hit = self.entries.get(f["id"])
+        if hit and version and hit.get("version") == version:
+            return hit, True
+        download_asset(svc, f, tsv_local)
+        narration, policy, faixa = narration_from_rows(load_tsv_rows(tsv_local))
+        entry = {"version": version, "name": f["name"], "narration": narration,
+                 "policy": policy, "faixa_ave_maria": faixa}
+        with self._lock:
+            self.entries[f["id"]] = entry
+            self.dirty = True
+        return entry, False
+
+    def save(self):
+        with self._lock:
+            live = {f["id"] for f in self.by_name.values()}
+            if not self.dirty and set(self.entries) <= live:
+                return
+            data = {"scripts": {fid: e for fid, e in self.entries.items() if fid in live}}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
 # -------------------- THUMB ---------------------
-def make_thumb(base_img, title, out_jpg):
-    img = Image.open(base_img).convert("RGB").resize((W, H))
-    draw = ImageDraw.Draw(img)
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 140))
-    img = Image.alpha_composite(img.convert("RGBA"), overlay)
+THUMB_FONT = "DejaVuSans-Bold.ttf"
+
+@functools.lru_cache(maxsize=4)
+def thumb_font(size: int):
+    # carregada uma vez por tamanho (a fonte TrueType é relida a cada truetype())
     try:
-        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 88)
-    except:
-        font = ImageFont.load_default()
+        return ImageFont.truetype(THUMB_FONT, size)
+    except OSError:
+        return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=16)
+def _thumb_base(path: str, mtime_ns: int, size):
+    img = ImageOps.fit(Image.open(path).convert("RGB"), size, Image.LANCZOS)
+    overlay = Image.new("RGBA", size, (0, 0, 0, 140))
+    return Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
 
+def thumb_base(path: str):
+    """Base escurecida na resolução final, reaproveitada por todos os títulos da mesma imagem."""
+    return _thumb_base(path, os.stat(path).st_mtime_ns, (W, H))
+
+def thumb_lines(title: str):
     words = to_str(title)[:70].split()
     lines, line = [], ""
     for w in words:
@@ -238,88 +849,413 @@ def make_thumb(base_img, title, out_jpg):
             line = w
         if len(lines) >= 3: break
     if line and len(lines) < 3: lines.append(line)
+    return lines
+
+def draw_thumb(base, title: str, out_jpg: str):
+    img = base.copy()
+    draw = ImageDraw.Draw(img, "RGBA")
+    font = thumb_font(max(12, round(88 * H / 1080)))
+    step = round(100 * H / 1080)
+
+    lines = thumb_lines(title)
+    boxes = [draw.textbbox((0, 0), ln, font=font) for ln in lines]
+    block = step * (len(lines) - 1) + (boxes[-1][3] - boxes[0][1] if boxes else 0)
+    y = (H - block) // 2
+    for ln, (x0, y0, x1, y1) in zip(lines, boxes):
+        # textbbox inclui o deslocamento do glifo: desconta para centralizar de verdade
+        draw.text(((W - (x1 - x0)) // 2 - x0, y - boxes[0][1]), ln, font=font, fill=(255, 255, 255, 240))
+        y += step
+
+    img.save(out_jpg, "JPEG", quality=92)
+
+def make_thumbs(base_img: str, items):
+    """Lote de thumbs da mesma imagem: items = [(título, saída.jpg), ...]."""
+    base = thumb_base(base_img)
+    for title, out_jpg in items:
+        draw_thumb(base, title, out_jpg)
 
-    y = H // 2 - (len(lines) * 90) // 2
-    for ln in lines:
-        wtxt, _ = draw.textsize(ln, font=font)
-        x = (W - wtxt) // 2
-        draw.text((x, y), ln, font=font, fill=(255, 255, 255, 240))
-        y += 100
+# -------------------- TTS -----------------------
+def tts_voice(lang: str) -> str:
+    return TTS_VOICES.get(lang, TTS_VOICES["pt"])
 
-    img.convert("RGB").save(out_jpg, "JPEG", quality=92)
+def normalize_tts_text(text: str) -> str:
+    return re.sub(r"\s+", " ", to_str(text).replace('"', "")).strip()
 
-# -------------------- TTS -----------------------
-def build_tts_wav(text: str, out_wav: str, lang: str):
-    text = text.replace('"', "")
+def split_sentences(text: str):
+    return [p.strip() for p in re.split(r"(?<=[.!?…])\s+", text) if p.strip()]
+
+@functools.lru_cache(maxsize=1)
+def edge_tts_available() -> bool:
     try:
-        sh("python -c \"import edge_tts\"")
-        voice_map = {
-            "pt": "pt-BR-AntonioNeural",
-            "en": "en-US-GuyNeural",
-            "es": "es-MX-JorgeNeural",
-            "pl": "pl-PL-MarekNeural",
-        }
-        voice = voice_map.get(lang, "pt-BR-AntonioNeural")
-        tmp_mp3 = out_wav.replace(".wav", ".mp3")
-        sh(f'python -m edge_tts --voice "{voice}" --text "{text}" --write-media "{tmp_mp3}"')
-        sh(f'ffmpeg -y -i "{tmp_mp3}" -ac 1 -ar 44100 "{out_wav}"')
-        os.remove(tmp_mp3)
-        return
-    except Exception:
-        pass
+        import edge_tts  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def mp3_to_wav(mp3: str, out_wav: str):
+    ffmpeg(["-i", mp3, "-ac", "1", "-ar", "44100", "-f", "wav", out_wav])
 
+def synth_gtts(lang: str, text: str, out_wav: str):
     from gtts import gTTS
-    tmp_mp3 = out_wav.replace(".wav", ".mp3")
-    gTTS(text=text, lang=("pt" if lang == "pt" else lang), slow=False).save(tmp_mp3)
-    sh(f'ffmpeg -y -i "{tmp_mp3}" -ac 1 -ar 44100 "{out_wav}"')
-    os.remove(tmp_mp3)
+    tmp_mp3 = out_wav + ".mp3"
+    try:
+        gTTS(text=text, lang=("pt" if lang == "pt" else lang), slow=False).save(tmp_mp3)
+        mp3_to_wav(tmp_mp3, out_wav)
+    finally:
+        if os.path.exists(tmp_mp3):
+            os.remove(tmp_mp3)
 
-# -------------------- AUDIO MIX -----------------
-def mix_voice_and_music(voice_wav: str, music_path, out_wav: str, target_sec: int):
-    if not music_path:
-        sh(f'ffmpeg -y -i "{voice_wav}" -t {target_sec} -af "apad=pad_dur={target_sec}" "{out_wav}"')
+async def synth_edge_async(lang: str, text: str, out_wav: str):
+    import edge_tts
+    tmp_mp3 = out_wav + ".mp3"
+    try:
+        await edge_tts.Communicate(text, tts_voice(lang)).save(tmp_mp3)
+        await asyncio.to_thread(mp3_to_wav, tmp_mp3, out_wav)
+    finally:
+        if os.path.exists(tmp_mp3):
+            os.remove(tmp_mp3)
+
+async def synth_chunks(lang: str, chunks, concurrency: int):
+    """Sintetiza [(texto, wav)] em paralelo (edge_tts assíncrono, no máximo `concurrency`
+    requisições simultâneas); cada trecho que falhar no edge cai para o gTTS sozinho."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    use_edge = edge_tts_available()
+
+    async def one(text: str, out_wav: str) -> str:
+        async with sem:
+            if use_edge:
+                try:
+                    await synth_edge_async(lang, text, out_wav)
+                    return "edge"
+                except Exception:
+                    # edge falhou neste trecho: só agora o gTTS em cache serve
+                    hit, _ = cached_tts(lang, text, ("gtts",))
+                    if hit:
+                        link_or_copy(hit, out_wav)
+                        return "gtts"
+            await asyncio.to_thread(synth_gtts, lang, text, out_wav)
+            return "gtts"
+
+    return await asyncio.gather(*(one(t, o) for t, o in chunks))
+
+def tts_key(engine: str, lang: str, text: str) -> str:
+    # edge depende da voz; gTTS só do idioma
+    who = tts_voice(lang) if engine == "edge" else lang
+    return f"tts|{engine}|{who}|{text}"
+
+def tts_engines():
+    # com o edge disponível o cache do gTTS não é lido: uma queda passageira do edge não
+    # prende o roteiro (nem frases de outros roteiros) na voz de fallback
+    return ("edge",) if edge_tts_available() else ("gtts",)
+
+def cached_tts(lang: str, text: str, engines=None):
+    if not TTS_CACHE:
+        return None, None
+    for engine in engines or tts_engines():
+        hit = TTS_CACHE.get(tts_key(engine, lang, text), ".wav")
+        if hit:
+            return hit, engine
+    return None, None
+
+def concat_wavs(parts, out_wav: str):
+    with wave.open(parts[0], "rb") as w0:
+        params = w0.getparams()
+    with wave.open(out_wav, "wb") as out:
+        out.setparams(params)
+        for p in parts:
+            with wave.open(p, "rb") as w:
+                if w.getparams()[:3] != params[:3]:
+                    raise RuntimeError(f"WAV de TTS com formato diferente: {p}")
+                out.writeframes(w.readframes(w.getnframes()))
+
+def build_tts_wav(text: str, out_wav: str, lang: str):
+    """Narração em WAV 44.1 kHz mono, sintetizada por frase em paralelo e unida em ordem.
+    Cacheia a narração inteira e cada frase, então roteiros repetidos e o preenchimento
+    por repetição não voltam ao serviço de TTS."""
+    text = normalize_tts_text(text)
+    hit, _ = cached_tts(lang, text)
+    if hit:
+        link_or_copy(hit, out_wav)
         return
-    sh(
-        f'ffmpeg -y -stream_loop -1 -i "{music_path}" -i "{voice_wav}" '
-        f'-filter_complex '
-        f'"[0:a]volume=0.18,aloop=loop=-1:size=2e6[a0];'
-        f'[a0]atrim=0:{target_sec}[m];'
-        f'[1:a]atrim=0:{target_sec}[v];'
-        f'[v][m]amix=inputs=2:normalize=0[a]" '
-        f'-map "[a]" -t {target_sec} "{out_wav}"'
+
+    workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(out_wav)))
+    try:
+        files, used, todo = {}, set(), []
+        sentences = split_sentences(text) or [text]
+        for sent in sentences:
+            if sent in files:
+                continue
+            files[sent] = os.path.join(workdir, f"s{len(files):04d}.wav")
+            hit, engine = cached_tts(lang, sent)
+            if hit:
+                link_or_copy(hit, files[sent])
+                used.add(engine)
+            else:
+                todo.append((sent, files[sent]))
+
+        if todo:
+            engines = asyncio.run(synth_chunks(lang, todo, TTS_CONCURRENCY))
+            for (sent, path), engine in zip(todo, engines):
+                used.add(engine)
+                if TTS_CACHE:
+                    TTS_CACHE.put(tts_key(engine, lang, sent), lambda tmp, src=path: shutil.copyfile(src, tmp), ".wav")
+
+        concat_wavs([files[s] for s in sentences], out_wav)
+        if TTS_CACHE and len(used) == 1:
+            TTS_CACHE.put(tts_key(used.pop(), lang, text), lambda tmp: shutil.copyfile(out_wav, tmp), ".wav")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# -------------------- AUDIO MIX -----------------
+def render_music_bed(music_path: str, target_sec: int, out_wav: str):
+    # trilha decodificada uma vez: em loop até target_sec, já atenuada, PCM 16 bits
+    ffmpeg(["-stream_loop", "-1", "-i", music_path, "-af", f"volume={MUSIC_GAIN}", "-t", str(target_sec),
+            "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", "-f", "wav", out_wav], target_sec)
+
+def music_bed(music_path: str, target_sec: int, out_wav: str) -> str:
+    """Bed da trilha para a mixagem; a mesma faixa/duração/ganho vem do cache."""
+    if BED_CACHE is None:
+        render_music_bed(music_path, target_sec, out_wav)
+        return out_wav
+    key = f"bed|{file_md5(music_path)}|{target_sec}|{MUSIC_GAIN}"
+    link_or_copy(BED_CACHE.fetch(key, lambda tmp: render_music_bed(music_path, target_sec, tmp), ".wav"), out_wav)
+    return out_wav
+
+def audio_mix_graph(voice_in: str, bed_in, target_sec: int) -> str:
+    # voz + bed (music_bed: já atenuado e com a duração final); saída rotulada [a]
+    if not bed_in:
+        return f"[{voice_in}]apad=pad_dur={target_sec}[a]"
+    return (
+        f"[{bed_in}]atrim=0:{target_sec}[m];"
+        f"[{voice_in}]atrim=0:{target_sec}[vo];"
+        f"[vo][m]amix=inputs=2:normalize=0[a]"
     )
 
+def mix_voice_and_music(voice_wav: str, bed_wav, out_wav: str, target_sec: int):
+    if not bed_wav:
+        ffmpeg(["-i", voice_wav, "-filter_complex", audio_mix_graph("0:a", None, target_sec),
+                "-map", "[a]", "-t", str(target_sec), out_wav], target_sec)
+        return
+    ffmpeg(["-i", bed_wav, "-i", voice_wav, "-filter_complex", audio_mix_graph("1:a", "0:a", target_sec),
+            "-map", "[a]", "-t", str(target_sec), out_wav], target_sec)
+
 # -------------------- VIDEO (MOVIMENTO SEGURO) --
 def escape_concat_path(p: str) -> str:
     return p.replace("'", "'\\''")
 
-def build_slideshow_concat_motion(img_paths, dur_sec: float, out_mp4: str):
+def file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def prescale_image(src: str, out_jpg: str):
+    # decodifica a foto uma vez (draft = downscale no próprio decoder JPEG), aplica a
+    # orientação EXIF e recorta/redimensiona para a tela exata do movimento
+    with Image.open(src) as im:
+        im.draft("RGB", (MOTION_W, MOTION_H))
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        im = ImageOps.fit(im, (MOTION_W, MOTION_H), Image.LANCZOS)
+        im.save(out_jpg, "JPEG", quality=92)
+
+def prescaled_frame(src: str, out_jpg: str) -> str:
+    if FRAME_CACHE is None:
+        prescale_image(src, out_jpg)
+        return out_jpg
+    key = f"frame|{MOTION_W}x{MOTION_H}|{file_md5(src)}"
+    link_or_copy(FRAME_CACHE.fetch(key, lambda tmp: prescale_image(src, tmp), ".jpg"), out_jpg)
+    return out_jpg
+
+def slideshow_cycle(img_paths, cycle_sec: float):
+    """Um ciclo do slideshow: [(imagem, duração)] somando cycle_sec, e a duração nominal por imagem."""
     if not img_paths:
         raise RuntimeError("Sem imagens para slideshow.")
-    per = max(3.5, dur_sec / len(img_paths))
+    per = max(3.5, cycle_sec / len(img_paths))
+    cycle, t = [], 0.0
+    for p in img_paths:
+        if t >= cycle_sec - 1e-6:
+            break
+        d = min(per, cycle_sec - t)
+        cycle.append((p, d))
+        t += d
+    return cycle, per
+
+def write_concat_list(txt: str, cycle, cycle_sec: float, start: float, end: float) -> int:
+    """Grava a lista do concat demuxer para [start, end) do slideshow em loop.
+    Retorna o índice (dentro do ciclo) da primeira imagem da lista."""
+    entries = []
+    base = math.floor(start / cycle_sec) * cycle_sec
+    while base < end - 1e-6:
+        t = base
+        for i, (p, d) in enumerate(cycle):
+            lo, hi = max(t, start), min(t + d, end)
+            if hi - lo > 1e-6:
+                entries.append((i, p, hi - lo))
+            t += d
+        base += cycle_sec
+    with open(txt, "w", encoding="utf-8") as f:
+        for _, p, d in entries:
+            f.write(f"file '{escape_concat_path(p)}'\n")
+            f.write(f"duration {d:.3f}\n")
+        f.write(f"file '{escape_concat_path(entries[-1][1])}'\n")
+    return entries[0][0]
+
+def motion_filter(per: float, n_cycle: int, first_idx: int = 0) -> str:
+    # O concat demuxer entrega 1 quadro por imagem: o crop é avaliado uma vez por imagem,
+    # na posição do início dela no ciclo. Usa o índice n (exato) em vez de t, que o
+    # demuxer arredonda para 1/25 s; assim cada volta do loop repete o mesmo enquadramento.
+    # Fotos de tamanhos diferentes reiniciariam o grafo (perdendo quadros e zerando n): a entrada
+    # usa -reinit_filter 0 e cada imagem é normalizada para a tela 10% maior antes do crop.
+    # Com quadros já pré-escalados (prescaled_frame) o scale/crop inicial não faz nada.
+    ts = f"mod(n+{first_idx},{n_cycle})*{per:.6f}"
+    return (
+        f"scale={MOTION_W}:{MOTION_H}:force_original_aspect_ratio=increase,crop={MOTION_W}:{MOTION_H},"
+        f"crop={W}:{H}:"
+        f"x='(iw-{W})*0.5*(1+sin(2*PI*{ts}/18))':"
+        f"y='(ih-{H})*0.5*(1+cos(2*PI*{ts}/22))',"
+        f"fps={FPS},format=yuv420p"
+    )
+
+def build_slideshow_concat_motion(img_paths, dur_sec: float, out_mp4: str):
+    cycle, per = slideshow_cycle(img_paths, dur_sec)
+
+    tmpdir = tempfile.mkdtemp()
+    txt = os.path.join(tmpdir, "list.txt")
+    write_concat_list(txt, cycle, dur_sec, 0.0, dur_sec)
+    vf = motion_filter(per, len(cycle))
+
+    try:
+        ffmpeg(["-reinit_filter", "0", "-f", "concat", "-safe", "0", "-i", txt,
+                "-vf", vf, "-t", f"{dur_sec:.3f}", "-movflags", "+faststart", out_mp4], dur_sec)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def mp4_flags(fragmented: bool):
+    # fragmentado: moov vazio no início e um fragmento por keyframe, então os bytes já
+    # gravados são definitivos e podem subir enquanto o encode continua
+    return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"] if fragmented else []
+
+def mux_final(vid_mp4: str, mix_wav: str, final_mp4: str, target_sec: int, fragmented: bool = False):
+    ffmpeg(["-stream_loop", "-1", "-i", vid_mp4, "-i", mix_wav,
+            "-shortest", "-t", str(target_sec),
+            "-map", "0:v:0", "-map", "1:a:0",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+            "-c:a", "aac", "-b:a", "160k", "-pix_fmt", "yuv420p",
+            *mp4_flags(fragmented), final_mp4], target_sec)
+
+def render_video_track(img_paths, cycle_sec: float, out_mp4: str, target_sec: int):
+    """Só o vídeo (slideshow em loop até target_sec), para ser copiado em vários idiomas."""
+    cycle, per = slideshow_cycle(img_paths, cycle_sec)
+
+    tmpdir = tempfile.mkdtemp()
+    txt = os.path.join(tmpdir, "list.txt")
+    write_concat_list(txt, cycle, cycle_sec, 0.0, float(target_sec))
+
+    try:
+        ffmpeg(["-reinit_filter", "0", "-f", "concat", "-safe", "0", "-i", txt,
+                "-vf", motion_filter(per, len(cycle)), "-t", str(target_sec), "-an",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p",
+                out_mp4], target_sec)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def segment_bounds(target_sec: int, segments: int):
+    """[(início, fim)] cobrindo [0, target_sec) em até `segments` trechos de GOPs inteiros."""
+    n_gops = math.ceil(target_sec / SEGMENT_GOP_SEC)
+    per = max(math.ceil(n_gops / max(1, segments)), math.ceil(SEGMENT_MIN_SEC / SEGMENT_GOP_SEC))
+    return [(g * SEGMENT_GOP_SEC, min((g + per) * SEGMENT_GOP_SEC, target_sec)) for g in range(0, n_gops, per)]
+
+def track_plan(render_mode: str, segments: int, cycle_sec: float, target_sec: int):
+    """Como montar a faixa de vídeo por trechos: (ciclo, [(início, fim)] a codificar, ordem dos
+    trechos na junção). No modo cycle, com pelo menos duas voltas completas, o ciclo é ajustado a
+    quadros inteiros, codificado uma vez e repetido; a volta final parcial reaproveita os trechos
+    iniciais do ciclo e só o pedaço que sobra é codificado à parte."""
+    if render_mode == "cycle":
+        cycle_frames = max(1, round(cycle_sec * FPS))
+        target_frames = round(target_sec * FPS)
+        repeats = target_frames // cycle_frames
+        if repeats >= 2:
+            cycle_sec = cycle_frames / FPS
+            pieces = segment_bounds(cycle_sec, segments)
+            order = list(range(len(pieces))) * repeats
+            rem = (target_frames - repeats * cycle_frames) / FPS
+            for i, (start, end) in enumerate(list(pieces)):
+                if end * FPS <= rem * FPS + 0.5:
+                    order.append(i)
+                    continue
+                if start < rem:
+                    pieces.append((start, rem))
+                    order.append(len(pieces) - 1)
+                break
+            return cycle_sec, pieces, order
+    pieces = segment_bounds(target_sec, segments)
+    return cycle_sec, pieces, list(range(len(pieces)))
+
+def render_video_segment(img_paths, cycle_sec: float, start: float, end: float, out_mp4: str):
+    """Trecho [start, end) da faixa de vídeo. A lista do concat começa na imagem certa do ciclo
+    e o movimento recebe o índice dela, então o enquadramento é o mesmo do encode inteiro.
+    GOP fixo (IDR a cada SEGMENT_GOP_SEC, sem corte por cena): os trechos se juntam por cópia."""
+    cycle, per = slideshow_cycle(img_paths, cycle_sec)
+    gop = str(SEGMENT_GOP_SEC * FPS)
 
     tmpdir = tempfile.mkdtemp()
     txt = os.path.join(tmpdir, "list.txt")
+    first_idx = write_concat_list(txt, cycle, cycle_sec, float(start), float(end))
+
+    try:
+        ffmpeg(["-reinit_filter", "0", "-f", "concat", "-safe", "0", "-i", txt,
+                "-vf", motion_filter(per, len(cycle), first_idx), "-frames:v", str(round((end - start) * FPS)), "-an",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p",
+                "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+                out_mp4], end - start)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
+def concat_segments(parts, out_mp4: str):
+    txt = out_mp4 + ".txt"
     with open(txt, "w", encoding="utf-8") as f:
-        for p in img_paths:
+        for p in parts:
             f.write(f"file '{escape_concat_path(p)}'\n")
-            f.write(f"duration {per:.3f}\n")
-        f.write(f"file '{escape_concat_path(img_paths[-1])}'\n")
+    try:
+        ffmpeg(["-f", "concat", "-safe", "0", "-i", txt, "-c", "copy", out_mp4])
+    finally:
+        os.remove(txt)
+
+def mux_shared_video(video_mp4: str, voice_wav: str, bed_wav, out_mp4: str, target_sec: int,
+                     fragmented: bool = False):
+    # vídeo copiado sem re-encode; só a mixagem do idioma é codificada
+    inputs = ["-i", video_mp4, "-i", voice_wav]
+    if bed_wav:
+        inputs += ["-i", bed_wav]
+    graph = audio_mix_graph("1:a", "2:a" if bed_wav else None, target_sec)
+    ffmpeg([*inputs,
+            "-filter_complex", graph,
+            "-map", "0:v:0", "-map", "[a]", "-t", str(target_sec),
+            "-c:v", "copy", "-c:a", "aac", "-b:a", "160k",
+            *mp4_flags(fragmented), out_mp4], target_sec)
+
+def render_single_pass(img_paths, cycle_sec: float, voice_wav: str, bed_wav, out_mp4: str, target_sec: int,
+                       fragmented: bool = False):
+    """Slideshow em loop + mixagem + encode final num único grafo (sem intermediário)."""
+    cycle, per = slideshow_cycle(img_paths, cycle_sec)
 
-    vf = (
-        f"scale=iw*1.10:ih*1.10,"
-        f"crop={W}:{H}:"
-        f"x='(iw-{W})*0.5*(1+sin(2*PI*t/18))':"
-        f"y='(ih-{H})*0.5*(1+cos(2*PI*t/22))',"
-        f"fps={FPS},format=yuv420p"
-    )
+    tmpdir = tempfile.mkdtemp()
+    txt = os.path.join(tmpdir, "list.txt")
+    write_concat_list(txt, cycle, cycle_sec, 0.0, float(target_sec))
+
+    inputs = ["-reinit_filter", "0", "-f", "concat", "-safe", "0", "-i", txt, "-i", voice_wav]
+    if bed_wav:
+        inputs += ["-i", bed_wav]
+    graph = f"[0:v]{motion_filter(per, len(cycle))}[v];" + audio_mix_graph("1:a", "2:a" if bed_wav else None, target_sec)
 
     try:
-        sh(
-            f'ffmpeg -y -f concat -safe 0 -i "{txt}" '
-            f'-vf "{vf}" -t {dur_sec:.3f} -movflags +faststart "{out_mp4}"'
-        )
+        ffmpeg([*inputs,
+                "-filter_complex", graph,
+                "-map", "[v]", "-map", "[a]", "-t", str(target_sec),
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-b:a", "160k",
+                *mp4_flags(fragmented), out_mp4], target_sec)
     finally:
         shutil.rmtree(tmpdir, ignore_errors=True)
 
@@ -331,175 +1267,956 @@ def normalize_jobs(raw):
         return [j for j in raw if isinstance(j, dict)]
     return []
 
-def get_latest_work_orders(svc, cfg_id: str):
+def get_latest_work_orders(svc, cfg_id: str, state=None):
     q = f"'{cfg_id}' in parents and trashed=false and name contains 'work_orders_'"
-    r = svc.files().list(q=q, orderBy="modifiedTime desc", pageSize=1, fields="files(id,name)").execute()
+    r = execute(svc.files().list(
+        q=q, orderBy="modifiedTime desc", pageSize=1, fields="files(id,name,size,md5Checksum,modifiedTime)"
+    ))
     if not r.get("files"):
         raise RuntimeError("Nenhum work_orders_*.json encontrado em 00_config.")
-    fid = r["files"][0]["id"]
-    raw = json.loads(download_text(svc, fid))
-    return normalize_jobs(raw), r["files"][0]["name"]
+    f = r["files"][0]
+    version = file_version(f)
+    # mesma versão do arquivo já vista: usa os jobs guardados no estado, sem baixar/reinterpretar
+    cached = state.cached_work_orders(f["id"], version) if state else None
+    if cached is not None:
+        return cached, f["name"]
+    jobs = normalize_jobs(json.loads(download_text(svc, f["id"])))
+    if state:
+        state.store_work_orders(f["id"], f["name"], version, jobs)
+    return jobs, f["name"]
+
+# -------------------- ESTADO --------------------
+def state_side_path(local_path: str) -> str:
+    # versão do snapshot do Drive que corresponde ao banco local
+    return local_path + ".remote.json"
+
+def pull_state_snapshot(svc, cfg_id: str, local_path: str, name: str = STATE_SNAPSHOT_NAME):
+    """Traz o snapshot de 00_config se ele for diferente do que o banco local já reflete.
+    Retorna os metadados do snapshot remoto (ou None se ainda não existe)."""
+    rs = list_by_name(svc, cfg_id, name)
+    if not rs:
+        return None
+    f = max(rs, key=lambda x: to_str(x.get("modifiedTime")))
+    version = file_version(f)
+    try:
+        with open(state_side_path(local_path), "r", encoding="utf-8") as fh:
+            side = json.load(fh)
+    except (OSError, ValueError):
+        side = {}
+    if os.path.exists(local_path) and side.get("id") == f["id"] and side.get("version") == version:
+        return f
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    download_binary(svc, f["id"], local_path + ".part")
+    os.replace(local_path + ".part", local_path)
+    with open(state_side_path(local_path), "w", encoding="utf-8") as fh:
+        json.dump({"id": f["id"], "version": version}, fh)
+    return f
+
+def push_state_snapshot(svc, cfg_id: str, state: JobState, remote, tmpdir: str, name: str = STATE_SNAPSHOT_NAME):
+    snap = os.path.join(tmpdir, name)
+    state.snapshot(snap)
+    if not remote:
+        # outro run do mesmo shard pode ter criado o snapshot enquanto este rodava
+        found = list_by_name(svc, cfg_id, name)
+        remote = max(found, key=lambda x: to_str(x.get("modifiedTime"))) if found else None
+    with open(snap, "rb") as fh:
+        media = MediaIoBaseUpload(fh, mimetype="application/x-sqlite3", resumable=True)
+        fields = "id,size,md5Checksum,modifiedTime"
+        if remote:
+            f = execute(svc.files().update(fileId=remote["id"], media_body=media, fields=fields))
+        else:
+            meta = {"name": name, "parents": [cfg_id]}
+            f = execute(svc.files().create(body=meta, media_body=media, fields=fields))
+    with open(state_side_path(state.path), "w", encoding="utf-8") as fh:
+        json.dump({"id": f["id"], "version": file_version(f)}, fh)
+
+# -------------------- MÉTRICAS ------------------
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+def timed_call(fn, *args):
+    """Roda fn no processo do pool e devolve (resultado, parede, CPU, progresso). O CPU inclui
+    os filhos (ffmpeg/ffprobe) já encerrados, que é onde o tempo do encode aparece; o progresso
+    é o do último ffmpeg do estágio (fps/frames do -progress)."""
+    _proc_local.stats = []
+    t0, c0 = time.monotonic(), os.times()
+    try:
+        out = fn(*args)
+    finally:
+        done, _proc_local.stats = _proc_local.stats, None
+    c1 = os.times()
+    cpu = (c1.user - c0.user) + (c1.system - c0.system) + \
+          (c1.children_user - c0.children_user) + (c1.children_system - c0.children_system)
+    return out, time.monotonic() - t0, cpu, (done[-1] if done else {})
+
+class Metrics:
+    """Um registro por estágio executado; gravado como JSONL ao lado do log do run."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, wall: float, cpu: float, job_id: str = "", ok: bool = True, **extra):
+        rec = {
+            "ts": datetime.now(timezone.utc).isoformat(), "stage": stage, "job_id": job_id,
+            "wall_sec": round(wall, 3), "cpu_sec": round(cpu, 3), "ok": ok,
+        }
+        rec.update({k: v for k, v in extra.items() if v not in (None, "")})
+        with self._lock:
+            self.records.append(rec)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str, job_id: str = ""):
+        """Mede parede e CPU da thread atual; o bloco pode preencher extras (ex.: bytes)."""
+        extra = {}
+        t0, c0 = time.monotonic(), time.thread_time()
+        try:
+            yield extra
+        except BaseException:
+            self.add(stage, time.monotonic() - t0, time.thread_time() - c0, job_id, ok=False, **extra)
+            raise
+        self.add(stage, time.monotonic() - t0, time.thread_time() - c0, job_id, **extra)
+
+    def write_jsonl(self, path: str):
+        with self._lock:
+            lines = [json.dumps(r, ensure_ascii=False) for r in self.records]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+def thread_profiler(run):
+    # até o 3.11 o cProfile só enxerga a thread que o ativou: um perfil por thread de job.
+    # No 3.12+ o perfil da thread principal já cobre todas e ativar outro falha (ValueError).
+    if run.profiles is None:
+        return None
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        return None
+    return prof
+
+def stop_profiler(run, prof):
+    if prof is None:
+        return
+    prof.disable()
+    with run._lock:
+        run.profiles.append(prof)
+
+# -------------------- AGENDA --------------------
+class StageTimings:
+    """Média móvel (EMA) do tempo de cada estágio, persistida entre execuções no cache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.stages = json.load(f).get("stages") or {}
+        except (OSError, ValueError):
+            self.stages = {}
+
+    def estimate(self, stage: str, per: float = 1.0) -> float:
+        with self._lock:
+            rate = (self.stages.get(stage) or {}).get("sec", STAGE_DEFAULTS.get(stage, 0.0))
+        return rate * per
+
+    def record(self, stage: str, sec: float, per: float = 1.0):
+        rate = sec / max(per, 1e-6)
+        with self._lock:
+            st = self.stages.get(stage)
+            if st is None:
+                self.stages[stage] = {"sec": rate, "n": 1}
+            else:
+                st["sec"] = (1 - STAGE_EMA_ALPHA) * st["sec"] + STAGE_EMA_ALPHA * rate
+                st["n"] = st.get("n", 0) + 1
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            data = json.dumps({"stages": self.stages}, indent=1)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+def estimate_group(run, specs) -> float:
+    t, n = run.timings, len(specs)
+    per_job = t.estimate("narration") + t.estimate("upload")
+    if n == 1:
+        return per_job + t.estimate("video", run.target_sec)
+    return n * (per_job + t.estimate("mux", run.target_sec)) + t.estimate("video", run.target_sec)
+
+def admit_group(run, specs):
+    """Reserva o tempo estimado do grupo se ele cabe no que resta do orçamento.
+    Os grupos já em andamento dividem os CPU_WORKERS com o novo, então a projeção
+    soma as reservas ativas. Retorna a reserva (liberar com release_group) ou None."""
+    est = estimate_group(run, specs)
+    with run._lock:
+        left = run.time_left()
+        if left is None or (est <= left and (run.reserved + est) / run.cpu_slots <= left):
+            run.reserved += est
+            return est
+    for spec in specs:
+        run.count("deferred")
+        run.state.release(spec["job_id"])
+        run.log(f"[DEFER] job_id={spec['job_id']} slot={spec['slot']} lang={spec['lang']} "
+                f"publishAt={spec['dt_pub'].isoformat()} est={est:.0f}s left={left:.0f}s")
+    return None
+
+def release_group(run, reserved: float):
+    with run._lock:
+        run.reserved -= reserved
+
+# -------------------- EXECUÇÃO ------------------
+class RenderRun:
+    """Estado compartilhado de uma execução: pastas, pools, contadores e log (thread-safe)."""
+
+    def __init__(self, clients, folders, index, target_sec: int, tmpdir: str, cpu_pool, render_mode: str,
+                 timings: StageTimings, deadline=None, cpu_slots: int = 1, metrics=None, profile: bool = False,
+                 stream_upload: bool = False, scripts=None, state=None, segments: int = 1,
+                 shard=(0, 1), share_video: bool = False, leases=None):
+        self.clients = clients
+        self.shard = shard
+        self.share_video = share_video
+        self.leases = leases
+        self.segments = max(1, segments)
+        self.state = state
+        self.scripts = scripts
+        self.stream_upload = stream_upload and clients.creds is not None
+        self.metrics = metrics or Metrics()
+        self.profiles = [] if profile else None
+        self.timings = timings
+        self.deadline = deadline
+        self.cpu_slots = max(1, cpu_slots)
+        self.reserved = 0.0
+        self.index = index
+        self.render_mode = render_mode
+        self.folders = folders
+        self.target_sec = target_sec
+        self.tmpdir = tmpdir
+        self.cpu_pool = cpu_pool
+        # thumbs (Pillow solta o GIL no resize/JPEG) rodam enquanto o ffmpeg codifica
+        self.thumb_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumb")
+        self.out_ids = {lg: folders[f"03_outputs_videos_{lg}"] for lg in LANGS}
+        self.th_ids = {lg: folders[f"04_outputs_thumbnails_{lg}"] for lg in LANGS}
+        self.counters = {"processed": 0, "skipped": 0, "failed": 0, "deferred": 0}
+        self.stale_layout = False
+        self._rendered = {}
+        self._workspaces = {}
+        self.log_lines = []
+        self._lock = threading.Lock()
+
+    @property
+    def svc(self):
+        return self.clients.get()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def log(self, line: str):
+        with self._lock:
+            self.log_lines.append(line)
+
+    def is_rendered(self, folder_id: str, job_id: str) -> bool:
+        with self._lock:
+            if folder_id not in self._rendered:
+                # primeira consulta lista todas as pastas de saída de uma vez (um batch por página)
+                todo = [fid for fid in {folder_id, *self.out_ids.values()} if fid not in self._rendered]
+                self._rendered.update(list_rendered_job_ids(self.svc, todo))
+            return job_id in self._rendered[folder_id]
+
+    def mark_rendered(self, folder_id: str, job_id: str):
+        with self._lock:
+            self._rendered.setdefault(folder_id, set()).add(job_id)
+
+    def workspace(self, ws_id: str) -> JobWorkspace:
+        # um objeto por job no run: a thread do job e o pool de thumbs gravam no mesmo manifesto
+        with self._lock:
+            if ws_id not in self._workspaces:
+                self._workspaces[ws_id] = JobWorkspace(WORKSPACE_ROOT, ws_id)
+            return self._workspaces[ws_id]
+
+    def time_left(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def owns(self, key: str) -> bool:
+        index, count = self.shard
+        return count <= 1 or shard_of(key, count) == index
+
+    @contextlib.contextmanager
+    def stage(self, name: str, per: float = 1.0):
+        # só registra estágios concluídos: uma falha não distorce a estimativa
+        t0 = time.monotonic()
+        yield
+        self.timings.record(name, time.monotonic() - t0, per)
+
+    def cpu_submit(self, fn, *args, stage: str = "", job_id: str = "", out: str = "", media_sec: float = 0.0):
+        """Agenda fn no pool de processos; devolve uma função que espera o resultado e
+        registra a métrica do estágio (bytes de saída e velocidade = mídia / parede).
+        wait.done() diz se o estágio já terminou, sem bloquear."""
+        fut = self.cpu_pool.submit(timed_call, fn, *args)
+        recorded = []
+
+        def wait():
+            res, wall, cpu, prog = fut.result()
+            if stage and not recorded:
+                recorded.append(True)
+                speed = round(media_sec / wall, 2) if media_sec and wall > 0 else None
+                self.metrics.add(stage, wall, cpu, job_id, bytes=file_size(out), speed=speed,
+                                 fps=prog.get("fps"), frames=prog.get("frames"))
+            return res
+        wait.done = fut.done
+        return wait
+
+    def cpu(self, fn, *args, **metric):
+        # estágios de ffmpeg rodam no pool de processos (limite CPU_WORKERS)
+        return self.cpu_submit(fn, *args, **metric)()
+
+def plan_jobs(run: RenderRun, jobs, now_utc, window_end):
+    planned = []
+    for idx, job in enumerate(jobs):
+        lang = to_str(job.get("idioma") or job.get("lang") or "pt").lower()
+        slot = to_str(job.get("slot"))
+        title = to_str(job.get("title") or job.get("titulo") or slot)
+
+        publish_at = to_str(job.get("publishAt") or job.get("publish_at") or job.get("publish_at_utc"))
+        dt_pub = parse_iso_utc(publish_at)
+
+        if not dt_pub:
+            run.count("skipped")
+            continue
+        if not (now_utc <= dt_pub <= window_end):
+            run.count("skipped")
+            continue
+
+        job_id = to_str(job.get("job_id") or job.get("id") or "")
+        if not job_id:
+            job_id = f"{slot}_{lang}_{dt_pub.strftime('%Y%m%d_%H%M')}_{idx}"
+        job_id = safe_slug(job_id)
+        # jobs que compartilham o vídeo precisam cair no mesmo shard
+        if not run.owns(f"{slot}|{dt_pub.isoformat()}" if run.share_video else job_id):
+            continue
+
+        out_folder = run.out_ids.get(lang, run.out_ids["pt"])
+        known = run.state.job(job_id)
+        if known and known["status"] == "done":
+            run.count("skipped")
+            continue
+        # todo job não concluído confere a pasta de saída (uma listagem por pasta no run): um crash
+        # depois do upload ou um snapshot antigo deixam o job pendente com o MP4 já publicado.
+        # MP4 enviado por este worker numa tentativa que falhou depois fica no plano: falta a thumb
+        if run.is_rendered(out_folder, job_id) and not run.workspace(job_id).value("upload_video"):
+            run.state.done(job_id)
+            run.count("skipped")
+            continue
+        run.state.plan(job_id, lang, slot, dt_pub.isoformat())
+
+        planned.append({
+            "job": job, "job_id": job_id, "lang": lang, "slot": slot, "title": title,
+            "dt_pub": dt_pub, "out_folder": out_folder,
+        })
+    # mais urgente primeiro: um job tardio na lista não atrasa um que publica antes
+    planned.sort(key=lambda spec: spec["dt_pub"])
+    return planned
+
+def pick_music(svc, folders, slot: str, musica_policy: str, faixa_ave: str, index=None):
+    mus_am = folders["01_assets_musicas_ave_maria"]
+    if slot == "maria_v2" and musica_policy == "ave_maria":
+        if faixa_ave:
+            cand = list_by_name(svc, mus_am, faixa_ave)
+            if cand:
+                fd, music_path = tempfile.mkstemp(suffix="_" + faixa_ave); os.close(fd)
+                download_asset(svc, cand[0], music_path)
+                return music_path, faixa_ave
+        return pick_random_local(svc, mus_am, AUD_EXTS, index)
+    return pick_random_local(svc, folders["01_assets_musicas"], AUD_EXTS, index)
+
+def prepare_narration(run: RenderRun, spec: dict):
+    """Roteiro + TTS de um job. Retorna None (job pulado) se não houver run_*.tsv."""
+    svc = run.svc
+    job, job_id, lang, slot = spec["job"], spec["job_id"], spec["lang"], spec["slot"]
+
+    tsv_file = run.scripts.find(slot, lang)
+    if not tsv_file:
+        run.count("skipped")
+        run.state.release(job_id)
+        return None
+
+    with run.stage("narration"):
+        tsv_local = os.path.join(run.tmpdir, f"run_{job_id}.tsv")
+        with run.metrics.measure("script", job_id) as m:
+            script, cached = run.scripts.parsed(svc, tsv_file, tsv_local)
+            m["cached"] = cached
+        narr_text, pol_from_tsv, faixa_ave_maria_tsv = script["narration"], script["policy"], script["faixa_ave_maria"]
+
+        ws = run.workspace(job_id)
+        voice_key = stage_key("voice", lang, tts_voice(lang), normalize_tts_text(narr_text))
+        voice = ws.get("voice", voice_key)
+        if voice is None:
+            voice_wav = ws.path("voice.wav")
+            with run.metrics.measure("tts", job_id) as m:
+                build_tts_wav(narr_text, voice_wav, lang)
+                m["bytes"] = file_size(voice_wav)
+            voice = ws.put("voice", voice_key, voice_wav, seconds=ffprobe_duration(voice_wav))
+
+    return {
+        "ws": ws,
+        "voice_wav": voice["path"],
+        "voice_len": voice["seconds"],
+        "musica_policy": to_str(job.get("musica_policy") or job.get("policy") or pol_from_tsv or "bg_random").lower(),
+        "faixa_ave": to_str(job.get("faixa_ave_maria")) or faixa_ave_maria_tsv,
+    }
+
+def fetch_images(run: RenderRun, slot: str, tag: str):
+    svc, folders = run.svc, run.folders
+    base_folder = folders["01_assets_imagens_maria"] if "maria" in slot else folders["01_assets_imagens_jesus"]
+    with run.metrics.measure("image_download", tag) as m:
+        img_paths, _ = download_many_images(svc, base_folder, limit=20, index=run.index)
+        if len(img_paths) < 1:
+            img_paths, _ = download_many_images(svc, folders["01_assets_brolls"], limit=10, index=run.index)
+        m["bytes"] = sum(file_size(p) for p in img_paths)
+    if len(img_paths) < 1:
+        raise RuntimeError("Sem imagens disponíveis (assets).")
+    frames = [os.path.join(run.tmpdir, f"frame_{tag}_{i:02d}.jpg") for i in range(len(img_paths))]
+    with run.metrics.measure("image_prescale", tag) as m:
+        frames = list(run.cpu_pool.map(prescaled_frame, img_paths, frames))
+        m["bytes"] = sum(file_size(p) for p in frames)
+    return frames
+
+def job_music(run: RenderRun, spec: dict, nar: dict):
+    with run.metrics.measure("music_download", spec["job_id"]) as m:
+        music_path, music_name = pick_music(run.svc, run.folders, spec["slot"], nar["musica_policy"], nar["faixa_ave"], run.index)
+        m["bytes"] = file_size(music_path)
+    if not music_path:
+        return None, None
+    bed_wav = os.path.join(run.tmpdir, f"bed_{spec['job_id']}.wav")
+    run.cpu(music_bed, music_path, run.target_sec, bed_wav,
+            stage="music_bed", job_id=spec["job_id"], out=bed_wav, media_sec=run.target_sec)
+    return bed_wav, music_name
+
+class LeaseLost(RuntimeError):
+    pass
+
+def check_lease(run: RenderRun, job_id: str):
+    # antes de publicar: sem o lease, outro worker pode estar enviando o mesmo job
+    if run.leases and not run.leases.holds(job_id):
+        raise LeaseLost("lease do job expirou (sem heartbeat); outro worker pode tê-lo retomado")
+
+def encode_final(run: RenderRun, spec: dict, final_mp4: str, fn, *args, stage: str = "", media_sec: float = 0.0):
+    """Roda o encode final (fn(*args, fragmented)) no pool. Com streaming, o MP4 sobe para o
+    Drive durante o encode; retorna o id do vídeo já enviado (ou None)."""
+    job_id = spec["job_id"]
+    # final.mp4 de uma tentativa anterior que não chegou ao checkpoint: o streaming começaria
+    # a enviar esses bytes antes de o novo encode recriar o arquivo
+    try:
+        os.remove(final_mp4)
+    except FileNotFoundError:
+        pass
+    wait = run.cpu_submit(fn, *args, run.stream_upload, stage=stage, job_id=job_id, out=final_mp4, media_sec=media_sec)
+    if not run.stream_upload:
+        wait()
+        return None
+
+    def finished():
+        if not wait.done():
+            return False
+        wait()  # erro do encode sobe aqui, antes de fechar a sessão com um arquivo parcial
+        # o chunk final publica o arquivo: sem o lease a sessão fica aberta e expira sozinha
+        check_lease(run, job_id)
+        return True
+
+    try:
+        with run.metrics.measure("upload_video_stream", job_id) as m:
+            video_id = upload_growing_file(run.clients.creds, spec["out_folder"], final_mp4, f"{job_id}.mp4",
+                                           "video/mp4", finished)
+            m["bytes"] = file_size(final_mp4)
+        return video_id
+    except LeaseLost:
+        raise
+    except Exception as e:
+        wait()  # se o encode falhou, o job falha por ele
+        msg = " | ".join(to_str(e).splitlines()[-2:]) or type(e).__name__
+        run.log(f"[WARN] job_id={job_id} upload em streaming falhou, reenviando o arquivo completo: {msg[:300]}")
+        return None
+
+def final_key(run: RenderRun, nar: dict) -> str:
+    # imagens e trilha são sorteadas: o MP4 pronto vale para o job enquanto a config e a narração forem as mesmas
+    return stage_key("final", run.render_mode, W, H, FPS, run.target_sec, nar["ws"].md5("voice"))
+
+def thumb_key(spec: dict) -> str:
+    return stage_key("thumb", spec["title"] or spec["slot"], W, H)
+
+def submit_thumbs(run: RenderRun, specs, base_img: str):
+    """Agenda as thumbs de todos os jobs do grupo (mesma imagem base) num único lote.
+    Thumbs já prontas no workspace do job não são refeitas."""
+    ready, todo = {}, []
+    for spec in specs:
+        ws = run.workspace(spec["job_id"])
+        hit = ws.get("thumb", thumb_key(spec))
+        if hit:
+            ready[spec["job_id"]] = hit["path"]
+        else:
+            todo.append((spec, ws.path("thumb.jpg")))
+    items = [(spec["title"] or spec["slot"], out) for spec, out in todo]
+
+    def batch():
+        if items:
+            with run.metrics.measure("thumbnail", ",".join(spec["job_id"] for spec, _ in todo)) as m:
+                make_thumbs(base_img, items)
+                m["bytes"] = sum(file_size(out) for _, out in items)
+            for spec, out in todo:
+                ready[spec["job_id"]] = run.workspace(spec["job_id"]).put("thumb", thumb_key(spec), out)["path"]
+        return ready
+    return run.thumb_pool.submit(batch)
+
+def resume_thumbs(run: RenderRun, specs):
+    """Thumbs de jobs cujo MP4 final já está no workspace: só baixa imagens se faltar alguma."""
+    missing = any(run.workspace(spec["job_id"]).get("thumb", thumb_key(spec)) is None for spec in specs)
+    base_img = fetch_images(run, specs[0]["slot"], specs[0]["job_id"])[0] if missing else None
+    return submit_thumbs(run, specs, base_img)
+
+def checkpoint_final(ws: JobWorkspace, key: str, final_mp4: str, music_name, video_id=None):
+    # o id do upload em streaming vai para o manifesto já aqui: se a thumb ou o lease falharem
+    # depois, a nova tentativa não envia o MP4 de novo
+    ws.put("final", key, final_mp4, music=music_name)
+    if video_id:
+        ws.note("upload_video", id=video_id, final_md5=ws.md5("final"))
+
+def finish_job(run: RenderRun, spec: dict, final_mp4: str, thumbs, music_name, video_id=None):
+    svc = run.svc
+    job_id, lang, slot = spec["job_id"], spec["lang"], spec["slot"]
+    check_lease(run, job_id)
+
+    ws = run.workspace(job_id)
+    with run.stage("upload"):
+        thumb_jpg = thumbs.result()[job_id]
+
+        sent = ws.value("upload_video")
+        if not video_id and sent and sent.get("final_md5") == ws.md5("final"):
+            video_id = sent["id"]  # este MP4 já subiu numa tentativa anterior; faltou só a thumb
+        if not video_id:
+            with run.metrics.measure("upload_video", job_id) as m:
+                m["bytes"] = file_size(final_mp4)
+                video_id = upload_file(svc, spec["out_folder"], final_mp4, f"{job_id}.mp4", "video/mp4")
+        ws.note("upload_video", id=video_id, final_md5=ws.md5("final"))
+        run.mark_rendered(spec["out_folder"], job_id)
+        with run.metrics.measure("upload_thumb", job_id) as m:
+            m["bytes"] = file_size(thumb_jpg)
+            thumb_id = upload_file(svc, run.th_ids.get(lang, run.th_ids["pt"]), thumb_jpg, f"{job_id}.jpg", "image/jpeg")
+    run.state.done(job_id, video_id, thumb_id)
+    resumed = f" resumed={','.join(ws.reused)}" if ws.reused else ""
+    ws.clear()
+
+    run.count("processed")
+    run.log(f"[OK] job_id={job_id} slot={slot} lang={lang} publishAt={spec['dt_pub'].isoformat()} "
+            f"music={music_name or 'none'}{resumed}")
+
+def submit_video_track(run: RenderRun, img_paths, cycle_sec: float, ws: JobWorkspace, key: str, job_id: str):
+    """Agenda a faixa de vídeo (slideshow em loop até target_sec, sem áudio); devolve a função
+    que espera por ela e retorna o MP4. Nos modos segmented/cycle os trechos rodam em paralelo
+    e a junção (cópia, com trechos repetidos no modo cycle) vem no fim. Uma faixa pronta no
+    workspace (mesma chave) não é codificada de novo."""
+    target_sec = run.target_sec
+    hit = ws.get("video", key)
+    if hit:
+        return lambda: hit["path"]
+    out_mp4 = ws.path("video.mp4")
+    if run.render_mode not in ("segmented", "cycle"):
+        enc = run.cpu_submit(render_video_track, img_paths, cycle_sec, out_mp4, target_sec,
+                             stage="slideshow_encode", job_id=job_id, out=out_mp4, media_sec=target_sec)
+
+        def wait_track():
+            enc()
+            return ws.put("video", key, out_mp4)["path"]
+        return wait_track
+
+    stem = os.path.splitext(out_mp4)[0]
+    cycle_sec, pieces, order = track_plan(run.render_mode, run.segments, cycle_sec, target_sec)
+    parts, waits = [], []
+    for i, (start, end) in enumerate(pieces):
+        part = f"{stem}_seg{i:03d}.mp4"
+        parts.append(part)
+        waits.append(run.cpu_submit(render_video_segment, img_paths, cycle_sec, start, end, part,
+                                    stage="segment_encode", job_id=job_id, out=part, media_sec=end - start))
+
+    def wait():
+        # espera todos os trechos antes de falhar, para não deixar encodes órfãos no pool
+        errors = []
+        for w in waits:
+            try:
+                w()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        try:
+            run.cpu(concat_segments, [parts[i] for i in order], out_mp4,
+                    stage="segment_concat", job_id=job_id, out=out_mp4)
+        finally:
+            for p in parts:
+                if os.path.exists(p):
+                    os.remove(p)
+        return ws.put("video", key, out_mp4)["path"]
+    return wait
+
+def render_job(run: RenderRun, spec: dict):
+    nar = prepare_narration(run, spec)
+    if nar is None:
+        return
+
+    target_sec, job_id, ws = run.target_sec, spec["job_id"], nar["ws"]
+    base_dur = min(max(nar["voice_len"], MIN_SLIDESHOW_SEC), target_sec)
+    key = final_key(run, nar)
+    final = ws.get("final", key)
+    if final:
+        # render concluído numa tentativa anterior que falhou no upload: só reenvia
+        finish_job(run, spec, final["path"], resume_thumbs(run, [spec]), final.get("music"))
+        return
+    final_mp4 = ws.path("final.mp4")
+    # faixa de vídeo de um job só: o ciclo vem da própria narração
+    track_key = stage_key("video", run.render_mode, W, H, FPS, target_sec, round(base_dur, 3))
+
+    with run.stage("video", target_sec):
+        img_paths = fetch_images(run, spec["slot"], job_id)
+        thumbs = submit_thumbs(run, [spec], img_paths[0])
+        if run.render_mode == "single":
+            bed_wav, music_name = job_music(run, spec, nar)
+            video_id = encode_final(run, spec, final_mp4, render_single_pass, img_paths, base_dur, nar["voice_wav"],
+                                    bed_wav, final_mp4, target_sec, stage="encode_single_pass", media_sec=target_sec)
+        elif run.render_mode in ("segmented", "cycle"):
+            track = submit_video_track(run, img_paths, base_dur, ws, track_key, job_id)
+            bed_wav, music_name = job_music(run, spec, nar)
+            video_id = encode_final(run, spec, final_mp4, mux_shared_video, track(), nar["voice_wav"], bed_wav,
+                                    final_mp4, target_sec, stage="final_mux", media_sec=target_sec)
+        else:
+            slide = ws.get("slideshow", track_key)
+            if slide is None:
+                vid_mp4 = ws.path("slideshow.mp4")
+                slideshow = run.cpu_submit(build_slideshow_concat_motion, img_paths, base_dur, vid_mp4,
+                                           stage="slideshow_encode", job_id=job_id, out=vid_mp4, media_sec=base_dur)
+            mix_key = stage_key("mix", target_sec, ws.md5("voice"))
+            mix = ws.get("mix", mix_key)
+            if mix is None:
+                bed_wav, music_name = job_music(run, spec, nar)
+                mix_wav = ws.path("mix.wav")
+                run.cpu(mix_voice_and_music, nar["voice_wav"], bed_wav, mix_wav, target_sec,
+                        stage="audio_mix", job_id=job_id, out=mix_wav, media_sec=target_sec)
+                mix = ws.put("mix", mix_key, mix_wav, music=music_name)
+            music_name = mix.get("music")
+            if slide is None:
+                slideshow()
+                slide = ws.put("slideshow", track_key, vid_mp4)
+            video_id = encode_final(run, spec, final_mp4, mux_final, slide["path"], mix["path"], final_mp4, target_sec,
+                                    stage="final_mux", media_sec=target_sec)
+        checkpoint_final(ws, key, final_mp4, music_name, video_id)
+
+    finish_job(run, spec, final_mp4, thumbs, music_name, video_id)
+
+def claim_group(run: RenderRun, specs):
+    """Leases dos jobs do grupo; devolve os que ficaram com este worker. Com o lease na mão,
+    confere a pasta de saída de novo: outro worker pode ter terminado o job depois do plano."""
+    if run.leases is None:
+        return specs
+    held = []
+    for spec in specs:
+        if run.leases.acquire(spec["job_id"]):
+            held.append(spec)
+        else:
+            run.count("skipped")
+            run.log(f"[LEASED] job_id={spec['job_id']} slot={spec['slot']} lang={spec['lang']} em outro worker")
+    if not held:
+        return held
+    # uma consulta de existência por job, todas no mesmo batch
+    svc = run.svc
+    found = batch(svc, {spec["job_id"]: svc.files().list(**by_name_query(spec["out_folder"], f"{spec['job_id']}.mp4"))
+                        for spec in held})
+    mine = []
+    for spec in held:
+        files = found[spec["job_id"]].get("files")
+        sent = run.workspace(spec["job_id"]).value("upload_video") if files else None
+        if sent and any(f["id"] == sent.get("id") for f in files):
+            mine.append(spec)  # o MP4 foi enviado por este worker numa tentativa que falhou depois: falta a thumb
+            continue
+        if files:
+            run.leases.release(spec["job_id"])
+            run.state.done(spec["job_id"])
+            run.count("skipped")
+            continue
+        mine.append(spec)
+    return mine
+
+def release_leases(run: RenderRun, specs):
+    if run.leases is None:
+        return
+    for spec in specs:
+        try:
+            run.leases.release(spec["job_id"])
+        except HttpError:
+            pass  # expira sozinho
+
+def render_group(run: RenderRun, specs):
+    """Jobs do mesmo slot/publishAt (idiomas diferentes): um único vídeo de movimento,
+    copiado (-c:v copy) para o MP4 de cada idioma; só a narração muda."""
+    specs = claim_group(run, specs)
+    if not specs:
+        return
+    reserved = admit_group(run, specs)
+    if reserved is None:
+        release_leases(run, specs)
+        return
+    for spec in specs:
+        run.state.start(spec["job_id"])
+    prof = thread_profiler(run)
+    try:
+        render_group_admitted(run, specs)
+    finally:
+        stop_profiler(run, prof)
+        release_group(run, reserved)
+        release_leases(run, specs)
+
+def render_group_admitted(run: RenderRun, specs):
+    if len(specs) == 1:
+        run_job_safe(run, specs[0])
+        return
+
+    prepared = []
+    for spec in specs:
+        try:
+            nar = prepare_narration(run, spec)
+        except Exception as e:
+            job_failed(run, spec, e)
+            continue
+        if nar is not None:
+            prepared.append((spec, nar))
+    if not prepared:
+        return
+
+    target_sec, lead = run.target_sec, prepared[0][0]
+    specs = [spec for spec, _ in prepared]
+    finals = {spec["job_id"]: nar["ws"].get("final", final_key(run, nar)) for spec, nar in prepared}
+    # a faixa compartilhada fica no workspace do grupo; o ciclo depende de quais idiomas ainda
+    # faltam, então a chave não inclui a duração (qualquer faixa do grupo serve na retomada)
+    gws = run.workspace(group_workspace_id(lead))
+    video_mp4 = None
+    try:
+        with run.stage("video", target_sec):
+            if all(finals.values()):
+                thumbs = resume_thumbs(run, specs)
+            else:
+                img_paths = fetch_images(run, lead["slot"], lead["job_id"])
+                thumbs = submit_thumbs(run, specs, img_paths[0])
+                # ciclo pela narração mais longa do grupo
+                voice_len = max(nar["voice_len"] for _, nar in prepared)
+                base_dur = min(max(voice_len, MIN_SLIDESHOW_SEC), target_sec)
+                track_key = stage_key("video", run.render_mode, W, H, FPS, target_sec, "group")
+                video_mp4 = submit_video_track(run, img_paths, base_dur, gws, track_key, lead["job_id"])()
+    except Exception as e:
+        for spec, _ in prepared:
+            job_failed(run, spec, e)
+        return
+
+    ok = True
+    for spec, nar in prepared:
+        try:
+            final = finals[spec["job_id"]]
+            if final:
+                finish_job(run, spec, final["path"], thumbs, final.get("music"))
+                continue
+            ws = nar["ws"]
+            bed_wav, music_name = job_music(run, spec, nar)
+            final_mp4 = ws.path("final.mp4")
+            with run.stage("mux", target_sec):
+                video_id = encode_final(run, spec, final_mp4, mux_shared_video, video_mp4, nar["voice_wav"], bed_wav,
+                                        final_mp4, target_sec, stage="final_mux", media_sec=target_sec)
+            checkpoint_final(ws, final_key(run, nar), final_mp4, music_name, video_id)
+            finish_job(run, spec, final_mp4, thumbs, music_name, video_id)
+        except Exception as e:
+            ok = False
+            job_failed(run, spec, e)
+    if ok:
+        gws.clear()
+
+def group_workspace_id(spec: dict) -> str:
+    return safe_slug(f"group_{spec['slot']}_{spec['dt_pub'].strftime('%Y%m%d_%H%M%S')}")
+
+def group_specs(planned, share_video: bool):
+    if not share_video:
+        return [[spec] for spec in planned]
+    groups = {}
+    for spec in planned:
+        groups.setdefault((spec["slot"], spec["dt_pub"]), []).append(spec)
+    return list(groups.values())
+
+def job_failed(run: RenderRun, spec: dict, e: Exception):
+    run.count("failed")
+    if isinstance(e, HttpError) and getattr(e.resp, "status", None) == 404:
+        run.stale_layout = True
+    msg = " | ".join(to_str(e).splitlines()[-3:]) or type(e).__name__
+    run.state.failed(spec["job_id"], msg)
+    run.log(f"[FAIL] job_id={spec['job_id']} slot={spec['slot']} lang={spec['lang']} err={msg[:500]}")
+
+def run_job_safe(run: RenderRun, spec: dict):
+    # falha de um job não derruba os demais; o run termina com erro no final
+    try:
+        render_job(run, spec)
+    except Exception as e:
+        job_failed(run, spec, e)
 
 # -------------------- MAIN ----------------------
 def preflight():
-    sh("ffmpeg -version")
-    sh("ffprobe -version")
+    run_proc(["ffmpeg", "-version"], timeout=60)
+    run_proc(["ffprobe", "-version"], timeout=60)
 
 def main():
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument("--duration", type=int, default=TARGET_SEC_DEFAULT)
+    parser.add_argument("--job-workers", type=int, default=JOB_WORKERS)
+    parser.add_argument("--cpu-workers", type=int, default=CPU_WORKERS)
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default=RENDER_MODE)
+    parser.add_argument("--share-video", action=argparse.BooleanOptionalAction, default=SHARE_VIDEO)
+    parser.add_argument("--segments", type=int, default=ENCODE_SEGMENTS, help="trechos por vídeo no modo segmented")
+    parser.add_argument("--budget-sec", type=int, default=RUN_BUDGET_SEC)
+    parser.add_argument("--profile", action="store_true", help="grava também um perfil cProfile (.prof) em 05_logs")
+    parser.add_argument("--stream-upload", action=argparse.BooleanOptionalAction, default=STREAM_UPLOAD)
+    parser.add_argument("--shard-index", type=int, default=SHARD_INDEX)
+    parser.add_argument("--shard-count", type=int, default=SHARD_COUNT)
+    parser.add_argument("--leases", action=argparse.BooleanOptionalAction, default=USE_LEASES)
     args, _ = parser.parse_known_args()
+    metrics = Metrics()
+    main_prof = cProfile.Profile() if args.profile else None
+    if main_prof:
+        main_prof.enable()
+    # o orçamento conta desde o início do processo (inclui listagens e TTS)
+    deadline = time.monotonic() + args.budget_sec if args.budget_sec > 0 else None
 
     target_sec = int(args.duration or TARGET_SEC_DEFAULT)
     horizon_hours = int(to_str(os.getenv("HORIZON_HOURS", "12")) or "12")
 
-    svc = build_drive_service_oauth()
-    ROOT = to_str(os.getenv("DRIVE_ROOT_FOLDER_ID"))
+    clients = build_storage_clients()
+    svc = clients.get()
+    # no backend local a raiz é o próprio LOCAL_STORAGE_ROOT (id "root"), salvo se indicada outra subpasta
+    ROOT = to_str(os.getenv("DRIVE_ROOT_FOLDER_ID")) or ("root" if STORAGE_BACKEND == "local" else "")
     if not ROOT:
         raise RuntimeError("DRIVE_ROOT_FOLDER_ID não definido.")
 
     preflight()
 
-    cfg_id     = ensure_folder(svc, ROOT, "00_config")
-    scripts_id = ensure_folder(svc, ROOT, "02_scripts_autogerados")
-    logs_id    = ensure_folder(svc, ROOT, "05_logs")
-
-    out_ids = {
-        "pt": ensure_folder(svc, ROOT, "03_outputs_videos_pt"),
-        "en": ensure_folder(svc, ROOT, "03_outputs_videos_en"),
-        "es": ensure_folder(svc, ROOT, "03_outputs_videos_es"),
-        "pl": ensure_folder(svc, ROOT, "03_outputs_videos_pl"),
-    }
-    th_ids = {
-        "pt": ensure_folder(svc, ROOT, "04_outputs_thumbnails_pt"),
-        "en": ensure_folder(svc, ROOT, "04_outputs_thumbnails_en"),
-        "es": ensure_folder(svc, ROOT, "04_outputs_thumbnails_es"),
-        "pl": ensure_folder(svc, ROOT, "04_outputs_thumbnails_pl"),
-    }
-
-    img_jesus = ensure_folder(svc, ROOT, "01_assets_imagens_jesus")
-    img_maria = ensure_folder(svc, ROOT, "01_assets_imagens_maria")
-    brolls    = ensure_folder(svc, ROOT, "01_assets_brolls")
-    mus_bg    = ensure_folder(svc, ROOT, "01_assets_musicas")
-    mus_am    = ensure_folder(svc, ROOT, "01_assets_musicas_ave_maria")
-
-    jobs, wo_name = get_latest_work_orders(svc, cfg_id)
+    layout_manifest = manifest_path_for(ROOT, CACHE_ROOT)
+    with metrics.measure("folder_resolution") as m:
+        folders, from_manifest = resolve_layout(svc, ROOT, LAYOUT_FOLDERS, layout_manifest)
+        m["cached"] = from_manifest
+    # estado dos jobs: o snapshot de 00_config só é baixado se mudou desde o último run nesta máquina
+    # cada shard tem o seu snapshot (os jobs de um shard nunca aparecem nos outros)
+    shard = (args.shard_index, max(1, args.shard_count))
+    if not 0 <= shard[0] < shard[1]:
+        raise RuntimeError(f"--shard-index {shard[0]} fora de 0..{shard[1] - 1}.")
+    shard_tag = f"_s{shard[0]}of{shard[1]}" if shard[1] > 1 else ""
+    state_name = state_snapshot_name(*shard)
+    state_path = os.path.join(CACHE_ROOT, f"state_{ROOT}{shard_tag}.sqlite")
+    with metrics.measure("state_pull"):
+        state_remote = pull_state_snapshot(svc, folders["00_config"], state_path, state_name)
+    state = JobState(state_path)
+    try:
+        with metrics.measure("work_orders"):
+            jobs, wo_name = get_latest_work_orders(svc, folders["00_config"], state)
+    except RuntimeError:
+        if not from_manifest:
+            raise
+        # manifesto pode estar desatualizado (pasta recriada/movida): resolve de novo e tenta outra vez
+        with metrics.measure("folder_resolution"):
+            folders, _ = resolve_layout(svc, ROOT, LAYOUT_FOLDERS, layout_manifest, refresh=True)
+        with metrics.measure("work_orders"):
+            jobs, wo_name = get_latest_work_orders(svc, folders["00_config"], state)
+
+    index = AssetIndex(os.path.join(CACHE_ROOT, f"asset_index_{ROOT}.json"), ROOT)
+    with metrics.measure("asset_index"):
+        # roteiros entram no mesmo índice: uma listagem (ou só o feed de mudanças) por run
+        index.sync(svc, [folders[n] for n in ASSET_FOLDERS] + [folders["02_scripts_autogerados"]])
+    scripts = ScriptIndex(os.path.join(CACHE_ROOT, f"scripts_{ROOT}.json"), index.files(folders["02_scripts_autogerados"]))
 
     now_utc = datetime.now(timezone.utc)
     window_end = now_utc + timedelta(hours=horizon_hours)
+    with metrics.measure("workspace_prune") as m:
+        m["removed"] = prune_workspaces(WORKSPACE_ROOT, WORKSPACE_MAX_AGE_HOURS * 3600)
 
     tmpdir = tempfile.mkdtemp()
-    log_lines = [f"UTC:{now_utc.isoformat()} work_orders:{wo_name} horizon_hours:{horizon_hours}"]
+    # spawn: o processo principal tem threads; fork herdaria locks em estado indefinido
+    cpu_pool = ProcessPoolExecutor(max_workers=max(1, args.cpu_workers), mp_context=mp.get_context("spawn"),
+                                   initializer=init_cpu_worker,
+                                   initargs=(thread_budget(args.cpu_workers), FFMPEG_NICE))
+    timings = StageTimings(os.path.join(CACHE_ROOT, "stage_timings.json"))
+    leases = None
+    if args.leases if args.leases is not None else shard[1] > 1:
+        locks, _ = resolve_layout(svc, folders["00_config"], [LOCKS_FOLDER],
+                                  manifest_path_for(folders["00_config"], CACHE_ROOT))
+        leases = Leases(clients.get, locks[LOCKS_FOLDER], WORKER_ID, LEASE_TTL_SEC)
+    # com leases vários runs do mesmo shard podem terminar juntos: log/métricas levam o worker
+    run_tag = shard_tag + (f"_{leases.worker_id}" if leases else "")
+    run = RenderRun(clients, folders, index, target_sec, tmpdir, cpu_pool, args.render_mode, timings, deadline,
+                    args.cpu_workers, metrics, args.profile, args.stream_upload, scripts, state,
+                    args.segments or args.cpu_workers, shard, args.share_video, leases)
+    run.log(f"UTC:{now_utc.isoformat()} work_orders:{wo_name} horizon_hours:{horizon_hours} budget_sec:{args.budget_sec or 'none'} "
+            f"threads_per_encode:{thread_budget(args.cpu_workers)} shard:{shard[0]}/{shard[1]} "
+            f"worker:{leases.worker_id if leases else 'sem leases'}")
 
     try:
-        processed = 0
-        skipped = 0
-
-        for idx, job in enumerate(jobs):
-            lang = to_str(job.get("idioma") or job.get("lang") or "pt").lower()
-            slot = to_str(job.get("slot"))
-            title = to_str(job.get("title") or job.get("titulo") or slot)
-
-            publish_at = to_str(job.get("publishAt") or job.get("publish_at") or job.get("publish_at_utc"))
-            dt_pub = parse_iso_utc(publish_at)
-
-            if not dt_pub:
-                skipped += 1
-                continue
-            if not (now_utc <= dt_pub <= window_end):
-                skipped += 1
-                continue
-
-            job_id = to_str(job.get("job_id") or job.get("id") or "")
-            if not job_id:
-                job_id = f"{slot}_{lang}_{dt_pub.strftime('%Y%m%d_%H%M')}_{idx}"
-            job_id = safe_slug(job_id)
-
-            out_folder = out_ids.get(lang, out_ids["pt"])
-            if file_exists_by_name_contains(svc, out_folder, job_id):
-                skipped += 1
-                continue
-
-            candidates = [f"run_{slot}_{lang}.tsv", f"run_{slot}.tsv"]
-            tsv_file_id = None
-            for nm in candidates:
-                rs = list_by_name(svc, scripts_id, nm)
-                if rs:
-                    tsv_file_id = rs[0]["id"]
-                    break
-            if not tsv_file_id:
-                skipped += 1
-                continue
-
-            tsv_local = os.path.join(tmpdir, f"run_{slot}_{lang}.tsv")
-            download_binary(svc, tsv_file_id, tsv_local)
-
-            rows = load_tsv_rows(tsv_local)
-            narr_text, pol_from_tsv, faixa_ave_maria_tsv = narration_from_rows(rows)
-
-            musica_policy = to_str(job.get("musica_policy") or job.get("policy") or pol_from_tsv or "bg_random").lower()
-            faixa_job = to_str(job.get("faixa_ave_maria"))
-            faixa_ave = faixa_job or faixa_ave_maria_tsv
-
-            voice_wav = os.path.join(tmpdir, f"voice_{job_id}.wav")
-            build_tts_wav(narr_text, voice_wav, lang)
-            voice_len = ffprobe_duration(voice_wav)
-
-            base_folder = img_maria if "maria" in slot else img_jesus
-            img_paths, _ = download_many_images(svc, base_folder, limit=20)
-            if len(img_paths) < 1:
-                img_paths, _ = download_many_images(svc, brolls, limit=10)
-            if len(img_paths) < 1:
-                raise RuntimeError("Sem imagens disponíveis (assets).")
-
-            base_dur = min(max(voice_len, MIN_SLIDESHOW_SEC), target_sec)
-            vid_mp4 = os.path.join(tmpdir, f"slideshow_{job_id}.mp4")
-            build_slideshow_concat_motion(img_paths, base_dur, vid_mp4)
-
-            music_path = None
-            music_name = None
-            if slot == "maria_v2" and musica_policy == "ave_maria":
-                if faixa_ave:
-                    cand = list_by_name(svc, mus_am, faixa_ave)
-                    if cand:
-                        fd, music_path = tempfile.mkstemp(suffix="_" + faixa_ave); os.close(fd)
-                        download_binary(svc, cand[0]["id"], music_path)
-                        music_name = faixa_ave
-                if not music_path:
-                    music_path, music_name = pick_random_local(svc, mus_am, AUD_EXTS)
-            else:
-                music_path, music_name = pick_random_local(svc, mus_bg, AUD_EXTS)
-
-            mix_wav = os.path.join(tmpdir, f"mix_{job_id}.wav")
-            mix_voice_and_music(voice_wav, music_path, mix_wav, target_sec)
-
-            final_mp4 = os.path.join(tmpdir, f"{job_id}.mp4")
-            sh(
-                f'ffmpeg -y -stream_loop -1 -i "{vid_mp4}" -i "{mix_wav}" '
-                f'-shortest -t {target_sec} '
-                f'-map 0:v:0 -map 1:a:0 '
-                f'-c:v libx264 -preset veryfast -crf 20 '
-                f'-c:a aac -b:a 160k -pix_fmt yuv420p '
-                f'"{final_mp4}"'
-            )
-
-            thumb_jpg = os.path.join(tmpdir, f"{job_id}.jpg")
-            make_thumb(img_paths[0], title or slot, thumb_jpg)
-
-            upload_file(svc, out_folder, final_mp4, f"{job_id}.mp4", "video/mp4")
-            upload_file(svc, th_ids.get(lang, th_ids["pt"]), thumb_jpg, f"{job_id}.jpg", "image/jpeg")
-
-            processed += 1
-            log_lines.append(f"[OK] job_id={job_id} slot={slot} lang={lang} publishAt={dt_pub.isoformat()} music={music_name or 'none'}")
-
-        logname = f"log_renderer_{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.txt"
-        txt = "\n".join(log_lines + [f"status:OK processed:{processed} skipped:{skipped}"])
+        planned = plan_jobs(run, jobs, now_utc, window_end)
+        groups = group_specs(planned, args.share_video)
+        with ThreadPoolExecutor(max_workers=max(1, args.job_workers)) as io_pool:
+            list(io_pool.map(lambda specs: render_group(run, specs), groups))
+
+        c = run.counters
+        status = "FAIL" if c["failed"] else "OK"
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+        logname = f"log_renderer_{stamp}{run_tag}.txt"
+        txt = "\n".join(run.log_lines + [
+            f"drive_api: {DRIVE.summary() or 'nenhuma chamada'}",
+            "state: " + " ".join(f"{k}={v}" for k, v in sorted(state.counts().items())),
+            f"status:{status} processed:{c['processed']} skipped:{c['skipped']} failed:{c['failed']} deferred:{c['deferred']}"
+        ])
         tmp_log = os.path.join(tmpdir, "log.txt")
         with open(tmp_log, "w", encoding="utf-8") as f:
             f.write(txt)
-        upload_file(svc, logs_id, tmp_log, logname, "text/plain")
-
+        upload_file(svc, folders["05_logs"], tmp_log, logname, "text/plain")
+        with metrics.measure("state_push"):
+            push_state_snapshot(svc, folders["00_config"], state, state_remote, tmpdir, state_name)
+
+        # uma linha por tipo de chamada ao Drive (parede = tempo dentro das chamadas)
+        for kind, st in DRIVE.stats().items():
+            metrics.add("drive_api", st.pop("sec"), 0.0, kind=kind, **st)
+        tmp_metrics = os.path.join(tmpdir, "metrics.jsonl")
+        metrics.write_jsonl(tmp_metrics)
+        upload_file(svc, folders["05_logs"], tmp_metrics, f"metrics_renderer_{stamp}{run_tag}.jsonl", "application/x-ndjson")
+        if main_prof:
+            main_prof.disable()
+            tmp_prof = os.path.join(tmpdir, "profile.prof")
+            pstats.Stats(main_prof, *run.profiles).dump_stats(tmp_prof)
+            upload_file(svc, folders["05_logs"], tmp_prof, f"profile_renderer_{stamp}{run_tag}.prof", "application/octet-stream")
+        if c["failed"]:
+            raise RuntimeError(f"{c['failed']} job(s) falharam; ver {logname}.")
+
+    except HttpError as e:
+        # 404 numa pasta do manifesto => id inválido; a próxima execução resolve do zero
+        if getattr(e.resp, "status", None) == 404:
+            invalidate_manifest(layout_manifest)
+        raise
     finally:
+        if run.stale_layout:
+            invalidate_manifest(layout_manifest)
+        try:
+            timings.save()
+            scripts.save()
+        except OSError:
+            pass
+        if leases:
+            leases.close()
+        state.close()
+        run.thumb_pool.shutdown(wait=True, cancel_futures=True)
+        cpu_pool.shutdown(wait=True, cancel_futures=True)
         shutil.rmtree(tmpdir, ignore_errors=True)
 
 if __name__ == "__main__":
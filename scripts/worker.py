@@ -5,6 +5,7 @@ Worker mínimo para validar OAuth e acesso ao Drive/Sheets.
 - Lê variáveis de ambiente do GitHub Actions.
 - Constrói serviços usando OAuth (client id/secret + refresh token).
 - Garante pastas-base e grava um log de batimento.
+- Chamadas ao Drive via drive_requests (limite de taxa, retry com backoff, contadores).
 """
 
 import os
@@ -18,6 +19,9 @@ from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 
+from drive_layout import resolve_layout, manifest_path_for
+from drive_requests import DRIVE, execute
+
 # ===== Scopes EXATOS (não altere) =====
 SCOPES = [
     "https://www.googleapis.com/auth/drive",
@@ -29,30 +33,18 @@ SCOPES = [
 # ===== Helpers de Drive =====
 def find_child_by_name(drive, parent_id, name):
     q = f"'{parent_id}' in parents and trashed=false and name='{name}'"
-    r = drive.files().list(q=q, fields="files(id,name,mimeType)").execute()
+    r = execute(drive.files().list(q=q, fields="files(id,name,mimeType)"))
     files = r.get("files", [])
     return files[0] if files else None
 
-def ensure_folder(drive, parent_id, name):
-    f = find_child_by_name(drive, parent_id, name)
-    if f and f.get("mimeType") == "application/vnd.google-apps.folder":
-        return f["id"]
-    meta = {
-        "name": name,
-        "mimeType": "application/vnd.google-apps.folder",
-        "parents": [parent_id],
-    }
-    f = drive.files().create(body=meta, fields="id,name").execute()
-    return f["id"]
-
 def upload_text(drive, parent_id, filename, content):
     # sobrescreve se já existir
     existing = find_child_by_name(drive, parent_id, filename)
     if existing:
-        drive.files().delete(fileId=existing["id"]).execute()
+        execute(drive.files().delete(fileId=existing["id"]))
     media = MediaIoBaseUpload(io.BytesIO(content.encode("utf-8")), mimetype="text/plain")
     meta = {"name": filename, "parents": [parent_id]}
-    return drive.files().create(body=meta, media_body=media, fields="id,name").execute()
+    return execute(drive.files().create(body=meta, media_body=media, fields="id,name"))
 
 # ===== Autenticação OAuth (com refresh token) =====
 def build_services_from_oauth():
@@ -86,10 +78,13 @@ def main():
 
     drive, _ = build_services_from_oauth()
 
-    # Garante estrutura mínima
-    cfg_id  = ensure_folder(drive, root_id, "00_config")
-    scp_id  = ensure_folder(drive, root_id, "02_scripts_autogerados")
-    logs_id = ensure_folder(drive, root_id, "05_logs")
+    # Garante estrutura mínima (uma listagem da raiz; manifesto local nas próximas execuções)
+    folders, _ = resolve_layout(
+        drive, root_id, ["00_config", "02_scripts_autogerados", "05_logs"], manifest_path_for(root_id)
+    )
+    cfg_id  = folders["00_config"]
+    scp_id  = folders["02_scripts_autogerados"]
+    logs_id = folders["05_logs"]
 
     # Loga batimento/validação
     now = datetime.utcnow().strftime("%Y-%m-%d_%H%M%S")
@@ -102,6 +97,7 @@ def main():
         f"02_scripts_autogerados: {scp_id}",
         f"05_logs: {logs_id}",
         "scopes: " + ", ".join(SCOPES),
+        f"drive_api: {DRIVE.summary()}",
     ]
     upload_text(drive, logs_id, f"log_worker_{now}.txt", "\n".join(lines))
 